@@ -22,6 +22,8 @@ GPU_DECODE_SURFACES = 128  # Max decode surfaces for RTX 5090 (32GB VRAM)
 # GPU filter settings
 USE_SCALE_CUDA = True  # Use scale_cuda instead of scale_npp (faster)
 GPU_SCALE_ALGO = "lanczos"  # Scaling algorithm (lanczos, bicubic, bilinear)
+GPU_DOWNSCALE_NPP = True  # Use scale_npp for downscales (NPP kernels, supersampling)
+GPU_DOWNSCALE_ALGO = "super"  # scale_npp algorithm for downscales (super, lanczos, cubic)
 
 # Advanced NVENC settings
 NVENC_SPATIAL_AQ = True  # Spatial adaptive quantization
@@ -31,6 +33,36 @@ NVENC_SURFACES = 32  # Reduced to save VRAM and avoid initialization errors
 NVENC_MAXRATE = "5M"  # Reduced to 5M for space (was 6M)
 NVENC_BUFSIZE = "10M"  # 2x maxrate
 
+# NVENC blocks when lookahead plus reorder frames don't fit in its surface pool
+if NVENC_RC_LOOKAHEAD + 4 > NVENC_SURFACES:
+    raise ValueError(
+        f"NVENC_RC_LOOKAHEAD ({NVENC_RC_LOOKAHEAD}) + 4 must fit in NVENC_SURFACES ({NVENC_SURFACES})"
+    )
+
+NVENC_MULTIPASS = "qres"  # disabled, qres (quarter-res first pass), fullres
+
+# NVENC tuning profiles (encoder speed vs. quality at a given CQ).
+# "quality" would use a 32-frame lookahead, but lookahead plus reorder frames has to
+# fit in the NVENC_SURFACES pool, so it is capped at NVENC_SURFACES - 4 (28 on L4).
+NVENC_PROFILES = {
+    "fast": {"preset": "p4", "tune": "ll", "rc_lookahead": 0, "aq": False, "multipass": "disabled"},
+    "balanced": {"preset": GPU_PRESET, "tune": GPU_TUNE, "rc_lookahead": NVENC_RC_LOOKAHEAD, "aq": True, "multipass": NVENC_MULTIPASS},
+    "quality": {"preset": "p7", "tune": "hq", "rc_lookahead": min(32, NVENC_SURFACES - 4), "aq": True, "multipass": "fullres"},
+}
+NVENC_PROFILE = "auto"  # fast, balanced, quality, or auto (picked from the target CQ)
+
+if NVENC_PROFILE != "auto" and NVENC_PROFILE not in NVENC_PROFILES:
+    raise ValueError(
+        f"NVENC_PROFILE ({NVENC_PROFILE!r}) must be 'auto' or one of {', '.join(NVENC_PROFILES)}"
+    )
+FAST_ENCODE_MAX_DURATION = 1.5  # Segments shorter than this (s) use the fast profile
+
+# Successful GPU probe results are remembered here (keyed on GPU, driver and FFmpeg build),
+# so later cold starts skip the test encodes. Set to "" to always probe.
+GPU_PROBE_CACHE = os.path.join(
+    os.environ.get("XDG_CACHE_HOME", os.path.expanduser("~/.cache")), "video_processor", "gpu_probe.json"
+)
+
 # Decoder settings
 DECODER_THREADS = 2  # Keep it low for stability
 DECODER_SURFACES = 30 # L4 limit is around 32
@@ -47,14 +79,29 @@ INPUT_VIDEO = os.environ.get("INPUT_VIDEO", "input.mp4")
 OUTPUT_VIDEO = os.environ.get("OUTPUT_VIDEO", "output.mp4")
 EDITMAP_JSON = os.environ.get("EDITMAP_JSON", "editmap.json")
 
+# Where rendered segments live until concat. Point at tmpfs (e.g. /dev/shm/spliceo)
+# to keep the encode -> concat round trip off disk when RAM allows.
+SEGMENT_TEMP_DIR = os.environ.get("SEGMENT_TEMP_DIR", "temp_spliceo_v2")
+
 # Smart copy mode - copy segments without re-encoding when possible
 SMART_COPY_MODE = True
+COPY_BATCH_SIZE = 16  # Copy-mode segments remuxed per ffmpeg process
+SEGMENT_BATCH_SIZE = 4  # Re-encoded segments per ffmpeg process (shares one CUDA context)
+SHARED_DECODE_MAX_SPAN = 30  # Max seconds of back-to-back segments decoded once and split
 
 # Maximum workers for parallel processing
 # For GPU processing, limit to 2 to avoid VRAM conflicts but gain speed
 MAX_WORKERS = 2  
 MAX_PARALLEL_SEGMENTS = 2
 
+# Pin each worker's FFmpeg process to its own stripe of CPU cores
+# (avoids cross-socket memory traffic on hwdownload/hwupload copies)
+PIN_WORKER_CPUS = True
+
+# Large HTTP downloads are fetched as parallel byte ranges when the server allows it
+DOWNLOAD_CONNECTIONS = 8
+DOWNLOAD_PARALLEL_MIN_MB = 32
+
 # Timeout settings
 MAX_SEGMENT_TIMEOUT = 600  # 10 minutes per segment
 MAX_CONCAT_TIMEOUT = 600  # 10 minutes for concatenation
@@ -93,6 +140,7 @@ WATERMARK_PADDING = 0.8
 WATERMARK_SCALE = 0.08  # 8% of video width (was 12%)
 WATERMARK_OPACITY = 0.8
 WATERMARK_POSITION = "bottom_left"  # top_left, top_right, bottom_left, bottom_right
+GPU_WATERMARK = True  # Composite with overlay_cuda so watermarked segments stay on the GPU
 
 # ═══════════════════════════════════════════════════════════════
 # MEMORY OPTIMIZATION
@@ -100,7 +148,7 @@ WATERMARK_POSITION = "bottom_left"  # top_left, top_right, bottom_left, bottom_r
 
 # For RTX 5090 with 32GB VRAM, we can be aggressive
 GPU_MEMORY_FRACTION = 0.95  # Use 95% of available VRAM
-EXTRA_HW_FRAMES = 8  # Buffer frames in GPU memory
+EXTRA_HW_FRAMES = 16  # Buffer frames in GPU memory (headroom for NPP scaling)
 
 # ═══════════════════════════════════════════════════════════════
 # PERFORMANCE MONITORING
@@ -120,6 +168,7 @@ PRINT_FFMPEG_OUTPUT = False  # Print FFmpeg output for debugging
 # NVIDIA_DRIVER_CAPABILITIES=compute,utility,video
 # CUDA_TF32_ENABLED=1
 # CUDA_DEVICE_ORDER=PCI_BUS_ID
+# CUDA_DEVICE_MAX_CONNECTIONS=2
 
 # ═══════════════════════════════════════════════════════════════
 # QUALITY PRESETS
@@ -181,6 +230,17 @@ def get_dynamic_maxrate(width, height):
 # DISABLED: Taking too much time for long videos
 FINAL_UP_COMPRESS = False
 
+def get_nvenc_profile(cq, short=False):
+    """NVENC tuning for a segment encoded at the given CQ."""
+    # Segments that the final pass re-encodes only need to be fast, and very short
+    # segments end before lookahead/multipass can pay for their startup cost
+    if FINAL_UP_COMPRESS or short:
+        return NVENC_PROFILES["fast"]
+    name = NVENC_PROFILE
+    if name == "auto":
+        name = "quality" if cq <= 20 else "fast" if cq >= 28 else "balanced"
+    return NVENC_PROFILES[name]
+
 def get_active_preset():
     """Get the active quality preset settings."""
     return QUALITY_PRESETS.get(ACTIVE_PRESET, QUALITY_PRESETS["fast"])
\ No newline at end of file
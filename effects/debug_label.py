@@ -0,0 +1,38 @@
+"""
+Debug Label Module
+
+Pre-renders the per-segment "[i]" debug label to a small RGBA image so the
+pure-GPU path can draw it with overlay_cuda instead of CPU drawtext.
+"""
+import os
+from typing import Optional
+
+try:
+    from PIL import Image, ImageDraw, ImageFont
+except ImportError:
+    Image = None
+
+
+def can_render_labels() -> bool:
+    """Whether labels can be pre-rendered (Pillow is installed)."""
+    return Image is not None
+
+
+def render_debug_label(seg_idx: int, out_dir: str) -> Optional[str]:
+    """Render the yellow-on-black "[i]" label for a segment and return its path."""
+    if Image is None:
+        return None
+
+    path = os.path.join(out_dir, f"label_{seg_idx:04d}.png")
+    if os.path.exists(path):
+        return path
+
+    text = f"[{seg_idx}]"
+    font = ImageFont.load_default()
+    left, top, right, bottom = ImageDraw.Draw(Image.new("RGBA", (1, 1))).textbbox((0, 0), text, font=font)
+
+    # Match drawtext's box=1:boxcolor=black@0.7 look
+    img = Image.new("RGBA", (right - left + 8, bottom - top + 8), (0, 0, 0, 178))
+    ImageDraw.Draw(img).text((4 - left, 4 - top), text, font=font, fill=(255, 255, 0, 255))
+    img.save(path)
+    return path
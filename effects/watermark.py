@@ -87,10 +87,11 @@ def build_watermark_filter(video_width: int, video_height: int) -> Optional[str]
 
 def build_watermark_filter_integrated(video_width: int, video_height: int, 
                                       input_label: str = "[v_in]", 
-                                      output_label: str = "[v_out]") -> Optional[str]:
+                                      output_label: str = "[v_out]",
+                                      watermark_label: str = "[1:v]") -> Optional[str]:
     """
     Build FFmpeg filter for watermark overlay to be used in a larger filter complex.
-    Assumes watermark is input [1:v].
+    The watermark is read from watermark_label (input [1:v] by default).
     """
     if not WATERMARK_URL:
         return None
@@ -103,13 +104,16 @@ def build_watermark_filter_integrated(video_width: int, video_height: int,
     scale = f"scale={wm_width}:-1"
     opacity = f"format=rgba,colorchannelmixer=aa={WATERMARK_OPACITY}"
     
-    return f"[1:v]{scale},{opacity}[wm];{input_label}[wm]overlay={x_pos}:{y_pos}:shortest=1{output_label}"
+    wm = f"[wm_{output_label.strip('[]')}]"
+    return f"{watermark_label}{scale},{opacity}{wm};{input_label}{wm}overlay={x_pos}:{y_pos}:shortest=1{output_label}"
 
 
-def build_watermark_filter_gpu(video_width: int, video_height: int) -> Optional[str]:
+def build_watermark_filter_gpu(video_width: int, video_height: int,
+                               input_label: str = "[v_in]",
+                               watermark_label: str = "[1:v]") -> Optional[str]:
     """
     Build GPU-accelerated FFmpeg filter for watermark overlay.
-    Uses overlay_cuda which requires both inputs to be in CUDA memory.
+    input_label must carry CUDA frames; the output is left unlabelled for the caller.
     """
     if not WATERMARK_URL:
         return None
@@ -119,16 +123,20 @@ def build_watermark_filter_gpu(video_width: int, video_height: int) -> Optional[
         WATERMARK_POSITION, video_width, video_height, wm_width, WATERMARK_PADDING
     )
     
-    # Upload watermark to GPU, scale it there, and overlay
-    # Note: overlay_cuda doesn't support shortest=1 in some versions, 
-    # but we can use it if available or handle it via input duration.
-    # For now, we'll use the basic overlay_cuda syntax.
-    scale = f"scale_cuda={wm_width}:-1:format=nv12"
-    
-    # Opacity on GPU is tricky without custom shaders, so we'll do it on CPU before upload
+    # Scale and apply opacity on the small watermark image on CPU, then upload it
+    # as yuva420p. overlay_cuda only blends yuva420p onto yuv420p (NV12 takes NV12
+    # overlays only, without alpha), so the main frames are converted on the GPU
+    # for the overlay and returned as NV12 for NVENC. 4:2:0 needs even dimensions.
+    scale = f"scale={wm_width - wm_width % 2}:-2"
     opacity = f"format=rgba,colorchannelmixer=aa={WATERMARK_OPACITY}"
     
-    return f"[1:v]{opacity},hwupload_cuda,{scale}[wm];[v_in][wm]overlay_cuda={x_pos}:{y_pos}"
+    tag = input_label.strip('[]')
+    wm, main = f"[wm_{tag}]", f"[main_{tag}]"
+    return (
+        f"{watermark_label}{scale},{opacity},format=yuva420p,hwupload_cuda{wm};"
+        f"{input_label}scale_cuda=format=yuv420p{main};"
+        f"{main}{wm}overlay_cuda=x={x_pos}:y={y_pos}:shortest=1,scale_cuda=format=nv12"
+    )
 
 
 # =============================================================================
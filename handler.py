@@ -14,6 +14,7 @@ from processor.timeline import create_segments
 from processor.final_renderer import render_final_video
 from utils.video import get_video_info, get_output_resolution
 from processor.job_parser import parse_job_input, load_edit_data
+from utils.gpu import init_gpu
 from effects.watermark import apply_watermark, download_watermark, cleanup_watermark
 
 import signal
@@ -38,7 +39,7 @@ def handler(job):
         print(f"DEBUG: Job Input - Video: {v_url}, Edits: {e_url}, Res: {o_res}, Paid: {is_paid}")
 
         log(f"Downloading files (Target: {o_res}, Paid: {is_paid})...")
-        download_file(v_url, INPUT_VIDEO, 8192, 300) 
+        download_file(v_url, INPUT_VIDEO, timeout=300) 
         edit_data = load_edit_data(e_url)
         
         # 🔑 SPACE OPTIMIZATION: If file is huge and disk is tight, compress it first
@@ -133,4 +134,7 @@ def handler(job):
         # cleanup_subtitle_files() 
         cleanup_watermark()
 
+# CUDA environment and GPU probe once per worker, before the first job
+init_gpu()
+
 runpod.serverless.start({"handler": handler})
\ No newline at end of file
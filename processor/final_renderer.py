@@ -1,18 +1,27 @@
 import os
 import shutil
 import time
-from config import *
+import itertools
+import threading
+from config import (
+    FFMPEG_BIN, SMART_COPY_MODE, CQ_QUALITY, DEBUG_OVERLAY, FINAL_UP_COMPRESS,
+    WATERMARK_URL, MAX_PARALLEL_SEGMENTS, COPY_BATCH_SIZE, SEGMENT_BATCH_SIZE,
+    MAX_CONCAT_TIMEOUT, ENABLE_GPU_MONITORING, SEGMENT_TEMP_DIR
+)
 from typing import List
 from models import Segment
-from utils.ffmpeg import run_ffmpeg
-from processor.segment_renderer import render_segment_smart
+from utils.ffmpeg import run_ffmpeg, pin_worker_cpus
+from processor.segment_renderer import render_segment_batch, render_copy_batch, requires_cpu_filters
+from effects.registry import get_segment_filters
 from utils.video import get_video_info, get_output_resolution
 from utils.gpu import (
     check_gpu_support, 
     get_gpu_info, 
+    get_free_vram_mb,
     monitor_gpu_usage,
     print_gpu_status,
-    get_gpu_compute_capability
+    get_gpu_compute_capability,
+    estimate_vram_per_worker
 )
 from concurrent.futures import ThreadPoolExecutor
 from effects.watermark import download_watermark, cleanup_watermark
@@ -23,7 +32,7 @@ def render_final_video(segments: List[Segment], input_path: str, output_path: st
     GPU-optimized final video rendering.
     Processes segments in parallel for maximum throughput.
     """
-    temp_dir = "temp_spliceo_v2"
+    temp_dir = SEGMENT_TEMP_DIR
     os.makedirs(temp_dir, exist_ok=True)
     
     # Print GPU status
@@ -36,9 +45,9 @@ def render_final_video(segments: List[Segment], input_path: str, output_path: st
         print("⚠️  WARNING: GPU not available, falling back to CPU encoding")
     else:
         print("✓ GPU acceleration enabled")
-        gpu_info = get_gpu_info()
-        if gpu_info:
-            print(f"✓ Available VRAM: {gpu_info['free_memory_mb']} MB")
+        free_vram_mb = get_free_vram_mb()
+        if free_vram_mb is not None:
+            print(f"✓ Available VRAM: {free_vram_mb} MB")
     
     print("="*60 + "\n")
     
@@ -61,27 +70,69 @@ def render_final_video(segments: List[Segment], input_path: str, output_path: st
         print("Downloading watermark for integrated rendering...")
         watermark_path = download_watermark(WATERMARK_URL)
 
-    # Prepare render arguments
-    render_args = [
-        (i, seg, input_path, temp_dir, info["fps"], DEBUG_OVERLAY, info["has_audio"],
-         orig_w, orig_h, render_w, render_h, is_paid, watermark_path, CQ_QUALITY)
-        for i, seg in enumerate(segments)
-    ]
+    # Prepare render arguments.
+    # Filter graphs are built here, single-threaded, so workers only run ffmpeg.
+    apply_wm = not is_paid and watermark_path and not FINAL_UP_COMPRESS
+    render_args = []
+    for i, seg in enumerate(segments):
+        if SMART_COPY_MODE and seg.can_copy:
+            # Stream-copied as-is; no filter graph to plan
+            reg_v, reg_a, needs_cpu = [], [], False
+        else:
+            reg_v, reg_a = get_segment_filters(seg, render_w, render_h, info["has_audio"])
+            needs_cpu = requires_cpu_filters(reg_v, DEBUG_OVERLAY, watermark_path if apply_wm else None)
+        render_args.append(
+            (i, seg, input_path, temp_dir, info["fps"], DEBUG_OVERLAY, info["has_audio"],
+             orig_w, orig_h, render_w, render_h, is_paid, watermark_path, CQ_QUALITY,
+             reg_v, reg_a, needs_cpu, info["audio_codec"], info["codec"])
+        )
+    
+    # Copy-mode segments are cheap remuxes; batch them so each group shares one ffmpeg process
+    copy_args = [a for a in render_args if SMART_COPY_MODE and a[1].can_copy]
+    render_args = [a for a in render_args if not (SMART_COPY_MODE and a[1].can_copy)]
+    copy_batches = [copy_args[j:j + COPY_BATCH_SIZE] for j in range(0, len(copy_args), COPY_BATCH_SIZE)]
+    
+    # Time order, so batches hold neighbouring segments that can share a decode
+    render_args.sort(key=lambda a: a[1].start)
+    
+    # Don't start more parallel NVDEC/NVENC sessions than free VRAM can hold.
+    # Each worker runs batch_size sessions at once inside one ffmpeg process.
+    sessions = MAX_PARALLEL_SEGMENTS * SEGMENT_BATCH_SIZE
+    if check_gpu_support():
+        # Read now, not from the cached GPU info: other tenants' usage changes between jobs
+        free_vram_mb = get_free_vram_mb()
+        if free_vram_mb is not None:
+            per_session_mb = estimate_vram_per_worker(max(orig_w, render_w), max(orig_h, render_h))
+            sessions = max(1, min(sessions, free_vram_mb // per_session_mb))
+            if sessions < MAX_PARALLEL_SEGMENTS * SEGMENT_BATCH_SIZE:
+                print(f"⚠️  Limiting concurrent segment encodes to {sessions} "
+                      f"(~{per_session_mb} MB VRAM each, {free_vram_mb} MB free)")
+    max_workers = min(MAX_PARALLEL_SEGMENTS, sessions)
+    batch_size = max(1, min(SEGMENT_BATCH_SIZE, sessions // max_workers))
+    
+    # Submit the most expensive batches first so the workers finish together
+    # instead of one worker grinding through a run of heavy segments at the end.
+    render_batches = [render_args[j:j + batch_size] for j in range(0, len(render_args), batch_size)]
+    render_batches.sort(key=lambda b: sum(_estimate_segment_cost(a[1], a[14]) for a in b), reverse=True)
     
     segment_files = []
     start_time = time.time()
     
     try:
         # Process segments in parallel
-        print(f"Processing {len(segments)} segments in parallel (Max workers: {MAX_PARALLEL_SEGMENTS})...")
+        print(f"Processing {len(segments)} segments in parallel (Max workers: {max_workers})...")
         
-        with ThreadPoolExecutor(max_workers=MAX_PARALLEL_SEGMENTS) as executor:
-            # Map the render function to the arguments
-            # We use a wrapper to handle the index and result
-            results = list(executor.map(render_segment_smart, render_args))
+        # Each pool thread gets its own CPU stripe, sized by the real worker count
+        with ThreadPoolExecutor(max_workers=max_workers, initializer=pin_worker_cpus,
+                                initargs=(itertools.count(), max_workers)) as executor:
+            # Keep the original segment index alongside each future for concat ordering
+            batch_jobs = [([a[0] for a in batch], executor.submit(render_segment_batch, batch))
+                          for batch in render_batches]
+            batch_jobs += [([a[0] for a in batch], executor.submit(render_copy_batch, batch))
+                           for batch in copy_batches]
             
-            for i, segment_file in enumerate(results):
-                segment_files.append((i, segment_file))
+            for indices, future in batch_jobs:
+                segment_files.extend(zip(indices, future.result()))
         
         processing_time = time.time() - start_time
         print(f"\n✓ All segments processed in {processing_time:.1f}s")
@@ -149,15 +200,42 @@ def render_final_video(segments: List[Segment], input_path: str, output_path: st
         print(f"\n❌ Error during processing: {e}")
         raise
     finally:
-        # Cleanup temp directory
+        # Cleanup temp directory in the background so we can return right away.
+        # Rename first so the next job can recreate temp_dir without racing the delete.
         if os.path.exists(temp_dir):
             try:
-                shutil.rmtree(temp_dir)
-                print("✓ Cleaned up temporary files")
+                trash_dir = f"{temp_dir}.trash.{os.getpid()}.{time.time_ns()}"
+                os.rename(temp_dir, trash_dir)
+                threading.Thread(target=_remove_temp_dir, args=(trash_dir,), daemon=False).start()
+                print("✓ Scheduled cleanup of temporary files")
             except Exception as e:
                 print(f"⚠️  Failed to cleanup temp directory: {e}")
 
 
+def _remove_temp_dir(path: str):
+    """Unlink segment files with a single scandir pass, then remove the directory."""
+    try:
+        with os.scandir(path) as entries:
+            for entry in entries:
+                try:
+                    if entry.is_dir(follow_symlinks=False):
+                        shutil.rmtree(entry.path, ignore_errors=True)
+                    else:
+                        os.unlink(entry.path)
+                except OSError:
+                    pass
+        os.rmdir(path)
+    except OSError as e:
+        print(f"⚠️  Failed to cleanup temp directory: {e}")
+
+
+def _estimate_segment_cost(seg: Segment, video_filters: List[str]) -> float:
+    """Rough relative render cost of a segment, used for scheduling order."""
+    if seg.can_copy:
+        return 0.1
+    return seg.duration * (1 + len(video_filters))
+
+
 def estimate_processing_time(segments: List[Segment], input_path: str) -> float:
     """
     Estimate processing time based on GPU capabilities and video properties.
@@ -202,10 +280,11 @@ def validate_gpu_setup():
     print(f"✓ GPU detected: {gpu_info['name']}")
     print(f"✓ Compute capability: {gpu_info['compute_capability']}")
     print(f"✓ Total VRAM: {gpu_info['total_memory_mb']} MB")
-    print(f"✓ Available VRAM: {gpu_info['free_memory_mb']} MB")
+    free_vram_mb = get_free_vram_mb() or 0
+    print(f"✓ Available VRAM: {free_vram_mb} MB")
     
     # Check minimum VRAM (4GB minimum recommended)
-    if gpu_info['free_memory_mb'] < 4000:
+    if free_vram_mb < 4000:
         print("⚠️  Warning: Less than 4GB VRAM available")
         print("   Processing may be slow or fail for large videos")
     
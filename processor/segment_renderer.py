@@ -1,21 +1,244 @@
 import os
+from functools import lru_cache
 from config import (
-    FFMPEG_BIN, SMART_COPY_MODE, AUDIO_BITRATE, CQ_QUALITY, 
+    FFMPEG_BIN, AUDIO_BITRATE, CQ_QUALITY, 
     MAX_SEGMENT_TIMEOUT, USE_SCALE_CUDA, GPU_SCALE_ALGO,
     DECODER_THREADS, DECODER_SURFACES, GPU_PRESET, GPU_TUNE,
     NVENC_MAXRATE, NVENC_BUFSIZE, FINAL_UP_COMPRESS,
     NVENC_RC_LOOKAHEAD, NVENC_SURFACES, GPU_ENCODER,
-    get_dynamic_maxrate, GPU_PROFILE
+    get_dynamic_maxrate, GPU_PROFILE, ENCODING_PRESET, CRF_QUALITY,
+    PRINT_FFMPEG_OUTPUT, SHARED_DECODE_MAX_SPAN, get_nvenc_profile,
+    GPU_DOWNSCALE_NPP, GPU_DOWNSCALE_ALGO, EXTRA_HW_FRAMES, GPU_WATERMARK,
+    FAST_ENCODE_MAX_DURATION
 )
-from typing import Tuple
+from typing import List, Optional, Tuple
 from models import Segment
 from utils.ffmpeg import run_ffmpeg
-from utils.gpu import check_gpu_support, get_gpu_compute_capability
+from utils.gpu import check_gpu_support, get_gpu_compute_capability, get_cuvid_decoders
 from utils.text import escape_filter_text
-from effects.registry import get_segment_filters
 from effects.watermark import build_watermark_filter_integrated, build_watermark_filter_gpu, download_watermark
+from effects.debug_label import render_debug_label, can_render_labels
+
+# ─────────────────────────────────────────────
+# Command templates (constant for the whole process)
+# ─────────────────────────────────────────────
+_HWACCEL_INPUT_TAIL = (
+    "-hwaccel_device", "0",
+    "-extra_hw_frames", str(EXTRA_HW_FRAMES),
+    "-threads", str(DECODER_THREADS),
+)
+# Frames always decode into CUDA memory; hybrid chains download only for their CPU filters
+_HWACCEL_INPUT_CUDA = ("-hwaccel", "cuda", "-hwaccel_output_format", "cuda") + _HWACCEL_INPUT_TAIL
+
+# Source codec -> dedicated NVDEC decoder, so CUDA-path decodes can't quietly fall back to CPU
+_CUVID_BY_CODEC = {
+    "h264": "h264_cuvid",
+    "hevc": "hevc_cuvid",
+    "vp9": "vp9_cuvid",
+    "av1": "av1_cuvid",
+}
+
+# Square pixels are stamped in the bitstream rather than with a setsar filter,
+# which would pull CUDA frames back to system memory.
+_SAR_BSF = {
+    "h264_nvenc": ("-bsf:v", "h264_metadata=sample_aspect_ratio=1/1"),
+    "hevc_nvenc": ("-bsf:v", "hevc_metadata=sample_aspect_ratio=1/1"),
+}
+
+# Segments are only read back by the concat step, which applies +faststart to the
+# final file, so they skip the moov-relocation rewrite.
+_NVENC_TAIL = _SAR_BSF.get(GPU_ENCODER, ()) + (
+    "-surfaces", str(NVENC_SURFACES),
+    "-tag:v", "avc1",
+    "-fps_mode", "passthrough",
+)
+
+
+@lru_cache(maxsize=16)
+def _nvenc_output_args(out_w: int, out_h: int, cq: int, short: bool = False) -> Tuple[str, ...]:
+    """NVENC encoder args; tuning comes from the NVENC profile, rate control from resolution and CQ."""
+    profile = get_nvenc_profile(cq, short)
+    maxrate = get_dynamic_maxrate(out_w, out_h)
+    head = (
+        "-c:v", GPU_ENCODER,
+        "-preset", profile["preset"],
+        "-tune", profile["tune"],
+        "-rc", "vbr",
+        "-cq", str(cq),
+        "-b:v", "0",
+        "-maxrate", maxrate,
+        "-bufsize", str(int(maxrate.replace('M','')) * 2) + "M",
+        "-profile:v", GPU_PROFILE,
+    )
+    tuning = ()
+    if profile["aq"]:
+        tuning += ("-spatial_aq", "1", "-temporal_aq", "1")
+    if profile["rc_lookahead"]:
+        tuning += ("-rc-lookahead", str(profile["rc_lookahead"]))
+    if profile["multipass"] != "disabled":
+        tuning += ("-multipass", profile["multipass"])
+    return head + tuning + _NVENC_TAIL
+
+
+def _decoder_input_args(video_codec: str) -> Tuple[str, ...]:
+    """
+    Decoder args placed before a segment's -i. Pins the matching cuvid decoder when
+    FFmpeg has it (cuvid sizes its own pool with -surfaces, not -extra_hw_frames).
+    """
+    cuvid = _CUVID_BY_CODEC.get(video_codec)
+    if cuvid and cuvid in get_cuvid_decoders():
+        return _HWACCEL_INPUT_CUDA + ("-c:v", cuvid, "-surfaces", str(DECODER_SURFACES))
+    return _HWACCEL_INPUT_CUDA
+
+
+@lru_cache(maxsize=4)
+def _segment_output_prefix(temp_dir: str) -> str:
+    return os.path.join(temp_dir, "seg_")
+
+
+def _segment_output_path(temp_dir: str, i: int) -> str:
+    """Path of segment i's rendered file; the directory prefix is joined once per temp_dir."""
+    return f"{_segment_output_prefix(temp_dir)}{i:04d}.mp4"
 
-def render_segment_smart(args: tuple) -> str:
+
+def _passthrough_audio_args(audio_codec: str) -> Tuple[str, ...]:
+    """
+    Codec args for audio with no filters: stream-copy AAC sources
+    (matches what copy-mode segments contain), re-encode anything else.
+    """
+    if audio_codec == "aac":
+        return ("-c:a", "copy")
+    return ("-c:a", "aac", "-b:a", AUDIO_BITRATE)
+
+
+def render_segment_batch(batch: List[tuple]) -> List[str]:
+    """
+    Render several segments with a single ffmpeg process (one CUDA context).
+    Each segment gets its own filter branch and NVENC output. Runs of contiguous
+    segments share one decoded input (split + trim); others get their own seeked input.
+    Segments must not be copy-mode (see render_copy_batch).
+    """
+    temp_outs = [_segment_output_path(args[3], args[0]) for args in batch]
+
+    if not check_gpu_support():
+        return [_render_cpu_fallback(args, temp_out) for args, temp_out in zip(batch, temp_outs)]
+
+    cmd = [FFMPEG_BIN, "-y"]
+    graphs = []
+    outputs = []
+    n_inputs = 0
+    for group in _shared_decode_groups(batch):
+        sources = [None] * len(group)
+        if len(group) > 1:
+            inputs, graph, sources = _build_shared_decode_parts([batch[k] for k in group], n_inputs)
+            cmd.extend(inputs)
+            n_inputs += 1
+            graphs.append(graph)
+        for k, source in zip(group, sources):
+            inputs, graph, output = _build_gpu_segment_parts(batch[k], n_inputs, temp_outs[k], source)
+            cmd.extend(inputs)
+            n_inputs += inputs.count("-i")
+            graphs.append(graph)
+            outputs.extend(output)
+
+    cmd.extend(["-filter_complex", ";".join(graphs)])
+    cmd.extend(outputs)
+
+    seg_ids = ", ".join(str(args[0]) for args in batch)
+    if PRINT_FFMPEG_OUTPUT:
+        print(f"DEBUG: Running FFmpeg command for segment(s) {seg_ids}:")
+        print(f"DEBUG: {' '.join(cmd)}")
+    
+    timeout = MAX_SEGMENT_TIMEOUT * len(batch)
+    try:
+        run_ffmpeg(cmd, timeout=timeout)
+    except RuntimeError as e:
+        if not _is_gpu_oom(str(e)):
+            raise
+        # Another session grabbed the VRAM we budgeted for; retry with a smaller surface pool
+        surfaces = max(8, NVENC_SURFACES // 2)
+        print(f"⚠️  Segment(s) {seg_ids} ran out of GPU memory, retrying with {surfaces} NVENC surfaces")
+        # Only the encoder pools shrink; cuvid inputs keep DECODER_SURFACES for their reference frames
+        rewritten, codec = [], None
+        for prev, arg in zip([None] + cmd, cmd):
+            if prev == "-c:v":
+                codec = arg
+            rewritten.append(str(surfaces) if prev == "-surfaces" and codec == GPU_ENCODER else arg)
+        run_ffmpeg(rewritten, timeout=timeout)
+    
+    if PRINT_FFMPEG_OUTPUT:
+        for args, temp_out in zip(batch, temp_outs):
+            if os.path.exists(temp_out):
+                size_mb = os.path.getsize(temp_out) / (1024 * 1024)
+                print(f"DEBUG: Segment {args[0]} rendered. Size: {size_mb:.2f} MB")
+        
+    return temp_outs
+
+
+def _shared_decode_groups(batch: List[tuple]) -> List[List[int]]:
+    """
+    Split a batch (in time order) into runs of back-to-back segments that can be
+    cut from one decoded stream: same source and a total span of at most
+    SHARED_DECODE_MAX_SPAN seconds. Hybrid and pure GPU segments can share a
+    decode, since both start from CUDA frames.
+    Returns lists of indices into batch.
+    """
+    groups: List[List[int]] = []
+    for k, args in enumerate(batch):
+        if groups:
+            first, prev = batch[groups[-1][0]], batch[groups[-1][-1]]
+            if (args[2] == prev[2]
+                    and abs(args[1].start - prev[1].end) < 0.001
+                    and args[1].end - first[1].start <= SHARED_DECODE_MAX_SPAN):
+                groups[-1].append(k)
+                continue
+        groups.append([k])
+    return groups
+
+
+def _build_shared_decode_parts(group: List[tuple], in_idx: int) -> Tuple[List[str], str, List[Tuple[str, Optional[str]]]]:
+    """
+    Decode a run of contiguous segments once, as ffmpeg input #in_idx, and cut
+    it into one trimmed branch per segment.
+    Returns (input args, filter graph, [(video label, audio label)] per segment).
+    """
+    first, last = group[0][1], group[-1][1]
+    input_path, has_audio = group[0][2], group[0][6]
+
+    inputs = list(_decoder_input_args(group[0][18]))
+    inputs.extend([
+        "-ss", str(first.start),
+        "-t", str(last.end - first.start),
+        "-i", input_path,
+    ])
+
+    tags = [args[0] for args in group]
+    graph = [f"[{in_idx}:v]split={len(group)}" + "".join(f"[sv{t}]" for t in tags)]
+    if has_audio:
+        graph.append(f"[{in_idx}:a]asplit={len(group)}" + "".join(f"[sa{t}]" for t in tags))
+
+    sources = []
+    for t, args in zip(tags, group):
+        seg = args[1]
+        # Input seeking resets timestamps, so offsets are relative to the run start
+        start, end = seg.start - first.start, seg.end - first.start
+        graph.append(f"[sv{t}]trim=start={start:.6f}:end={end:.6f},setpts=PTS-STARTPTS[gv{t}]")
+        if has_audio:
+            graph.append(f"[sa{t}]atrim=start={start:.6f}:end={end:.6f},asetpts=PTS-STARTPTS[ga{t}]")
+        sources.append((f"[gv{t}]", f"[ga{t}]" if has_audio else None))
+
+    return inputs, ";".join(graph), sources
+
+
+def _build_gpu_segment_parts(args: tuple, in_idx: int, temp_out: str,
+                             source: Optional[Tuple[str, Optional[str]]] = None) -> Tuple[List[str], str, List[str]]:
+    """
+    Build one segment's share of a (possibly multi-segment) GPU ffmpeg command.
+    Its own inputs start at ffmpeg input #in_idx: the seeked video (unless a shared
+    decoded (video, audio) source label pair is given), then the watermark, if any.
+    Filter labels are suffixed with the segment index so branches never collide.
+    Returns (input args, filter graph, output args).
+    """
     (
         i,
         seg,
@@ -31,78 +254,61 @@ def render_segment_smart(args: tuple) -> str:
         is_paid,
         watermark_path,
         seg_cq,
+        reg_v,
+        reg_a,
+        needs_cpu,
+        audio_codec,
+        video_codec,
     ) = args
 
-    temp_out = os.path.join(temp_dir, f"seg_{i:04d}.mp4")
+    # Filters and pipeline type (needs_cpu) were precomputed by the caller.
+    # Only apply watermark here if final pass is disabled
+    apply_wm = not is_paid and watermark_path and not FINAL_UP_COMPRESS
+
+    v_out = f"[v{i}]"
+    a_out = f"[a{i}]"
 
     # ─────────────────────────────────────────────
-    # SMART COPY
+    # Inputs
     # ─────────────────────────────────────────────
-    if seg.can_copy and SMART_COPY_MODE:
-        cmd = [
-            FFMPEG_BIN, "-y",
+    if source is None:
+        inputs = list(_decoder_input_args(video_codec))
+        inputs.extend([
             "-ss", str(seg.start),
             "-t", str(seg.duration),
             "-i", input_path,
-            "-c", "copy",
-            "-avoid_negative_ts", "make_zero",
-            temp_out,
-        ]
-        run_ffmpeg(cmd)
-        return temp_out
-
-    # ─────────────────────────────────────────────
-    # GPU availability
-    # ─────────────────────────────────────────────
-    if not check_gpu_support():
-        return _render_cpu_fallback(args, temp_out)
-
-    # ─────────────────────────────────────────────
-    # Collect filters and determine pipeline type
-    # ─────────────────────────────────────────────
-    reg_v, reg_a = get_segment_filters(seg, out_w, out_h, has_audio)
-    
-    # Only apply watermark here if final pass is disabled
-    apply_wm = not is_paid and watermark_path and not FINAL_UP_COMPRESS
-    needs_cpu = requires_cpu_filters(reg_v, debug_overlay, watermark_path if apply_wm else None)
-
-    # ─────────────────────────────────────────────
-    # Base FFmpeg command
-    # ─────────────────────────────────────────────
-    cmd = [
-        FFMPEG_BIN, "-y",
-        "-hwaccel", "cuda",
-    ]
-
-    # 🔑 KEY FIX: For hybrid paths, force decoder to output NV12 (system memory).
-    # For pure GPU paths, force decoder to output CUDA (GPU memory).
-    if needs_cpu:
-        cmd.extend(["-hwaccel_output_format", "nv12"])
+        ])
+        v_in = f"[{in_idx}:v]"
+        a_in = f"[{in_idx}:a]"
     else:
-        cmd.extend(["-hwaccel_output_format", "cuda"])
-
-    cmd.extend([
-        "-hwaccel_device", "0",
-        "-extra_hw_frames", "8",
-        "-threads", str(DECODER_THREADS),
-        "-ss", str(seg.start),
-        "-t", str(seg.duration),
-        "-i", input_path,
-    ])
+        # Frames come from a shared decode; trimmed audio can't be stream-copied
+        inputs = []
+        v_in, a_in = source
+        if has_audio and not reg_a:
+            reg_a = ["anull"]
+    wm_in = f"[{in_idx + inputs.count('-i')}:v]"
 
     # Add watermark input if needed
     if apply_wm:
         # Loop for static images, ignore_loop for GIFs
         is_gif = watermark_path.lower().endswith(".gif")
         if is_gif:
-            cmd.extend(["-ignore_loop", "0", "-i", watermark_path])
+            inputs.extend(["-ignore_loop", "0", "-i", watermark_path])
         else:
-            cmd.extend(["-loop", "1", "-i", watermark_path])
+            inputs.extend(["-loop", "1", "-i", watermark_path])
+
+    # Pre-rendered debug label, drawn on GPU with overlay_cuda (pure GPU path only)
+    label_path = render_debug_label(i, temp_dir) if debug_overlay and not needs_cpu else None
+    if label_path:
+        label_in = f"[{in_idx + inputs.count('-i')}:v]"
+        # The label has to last as long as the output, which speed edits shorten or stretch
+        speed = seg.edit.speed if seg.edit and seg.edit.speed > 0 else 1.0
+        inputs.extend(["-loop", "1", "-t", f"{seg.duration / speed:.6f}", "-i", label_path])
 
     # ─────────────────────────────────────────────
     # Build filter chain
     # ─────────────────────────────────────────────
-    gpu_filters = _build_gpu_filter_chain(
+    v_chain = _build_gpu_filter_chain(
         seg=seg,
         out_w=out_w,
         out_h=out_h,
@@ -112,103 +318,124 @@ def render_segment_smart(args: tuple) -> str:
         debug_overlay=debug_overlay,
         seg_idx=i,
         reg_v=reg_v,
-        is_paid=is_paid,
+        needs_cpu=needs_cpu,
     )
 
-    is_hybrid = needs_cpu
-
-    v_chain = ",".join(gpu_filters)
-
     # ─────────────────────────────────────────────
     # Build Filter Complex
     # ─────────────────────────────────────────────
     if needs_cpu:
-        # HYBRID PATH: GPU Decode -> CPU Filters -> GPU Encode
-        v_base = f"[0:v]{v_chain}"
+        # HYBRID PATH: GPU Decode + Scale -> CPU Filters -> GPU Encode
+        v_base = f"{v_in}{v_chain}"
         
         if apply_wm:
             wm_filter = build_watermark_filter_integrated(
-                out_w, out_h, input_label="[v_pre_wm]", output_label="[v_cpu]"
+                out_w, out_h, input_label=f"[v_pre_wm{i}]", output_label=f"[v_cpu{i}]",
+                watermark_label=wm_in
             )
             # 🔑 KEY FIX: Force nv12 after overlay to ensure stable hwupload_cuda
-            v_final = f"{v_base}[v_pre_wm];{wm_filter};[v_cpu]format=nv12,hwupload_cuda[v]"
+            v_final = f"{v_base}[v_pre_wm{i}];{wm_filter};[v_cpu{i}]format=nv12,hwupload_cuda{v_out}"
         else:
-            # 🔑 KEY FIX: Force nv12 before hwupload_cuda
-            v_final = f"{v_base},format=nv12,hwupload_cuda[v]"
+            # The chain already ends in format=nv12 for a stable hwupload_cuda
+            v_final = f"{v_base},hwupload_cuda{v_out}"
     else:
         # PURE GPU PATH: Everything stays on GPU
+        v_final = f"{v_in}{v_chain}"
         if apply_wm:
-            # We try to use GPU overlay if possible, but it's risky with alpha.
-            # For now, we'll use the GPU filter we built, but if it fails, 
-            # we should have forced needs_cpu earlier.
-            wm_filter = build_watermark_filter_gpu(out_w, out_h)
-            v_base = f"[0:v]{v_chain}[v_in];"
-            v_final = f"{v_base}{wm_filter}[v]"
-        else:
-            v_final = f"[0:v]{v_chain}[v]"
+            wm_filter = build_watermark_filter_gpu(
+                out_w, out_h, input_label=f"[v_in{i}]", watermark_label=wm_in
+            )
+            v_final = f"{v_final}[v_in{i}];{wm_filter}"
+        if label_path:
+            # overlay_cuda blends yuva420p only onto yuv420p, so convert around it
+            v_final = (
+                f"{v_final},scale_cuda=format=yuv420p[v_dbg{i}];"
+                f"{label_in}format=yuva420p,hwupload_cuda[lbl{i}];"
+                f"[v_dbg{i}][lbl{i}]overlay_cuda=x=10:y=10:shortest=1,scale_cuda=format=nv12"
+            )
+        v_final = f"{v_final}{v_out}"
 
     if has_audio and reg_a:
         a_chain = ",".join(reg_a)
-        filter_complex = f"{v_final};[0:a]{a_chain}[a]"
-        cmd.extend([
-            "-filter_complex", filter_complex,
-            "-map", "[v]",
-            "-map", "[a]",
+        graph = f"{v_final};{a_in}{a_chain}{a_out}"
+        output = [
+            "-map", v_out,
+            "-map", a_out,
             "-c:a", "aac",
             "-b:a", AUDIO_BITRATE,
-        ])
+        ]
     else:
-        filter_complex = v_final
-        cmd.extend([
-            "-filter_complex", filter_complex,
-            "-map", "[v]",
-        ])
+        graph = v_final
+        output = ["-map", v_out]
         if has_audio:
-            cmd.extend([
-                "-map", "0:a:0",
-                "-c:a", "aac",
-                "-b:a", AUDIO_BITRATE,
-            ])
+            output.extend(["-map", f"{in_idx}:a:0"])
+            output.extend(_passthrough_audio_args(audio_codec))
 
     # ─────────────────────────────────────────────
     # NVENC encode
     # ─────────────────────────────────────────────
-    cmd.extend([
-        "-c:v", GPU_ENCODER,
-        "-preset", GPU_PRESET,
-        "-tune", GPU_TUNE,
-        "-rc", "vbr",
-        "-cq", str(seg_cq),
-        "-b:v", "0",
-        "-maxrate", get_dynamic_maxrate(out_w, out_h),
-        "-bufsize", str(int(get_dynamic_maxrate(out_w, out_h).replace('M','')) * 2) + "M",
-        "-profile:v", GPU_PROFILE,
-        "-spatial_aq", "1",
-        "-temporal_aq", "1",
-        "-rc-lookahead", str(NVENC_RC_LOOKAHEAD),
-        "-surfaces", str(NVENC_SURFACES),
-        "-movflags", "+faststart",
-        "-tag:v", "avc1",
-        "-fps_mode", "passthrough",
-    ])
+    output.extend(_nvenc_output_args(out_w, out_h, seg_cq, seg.duration < FAST_ENCODE_MAX_DURATION))
 
     # 🔑 CRITICAL: Never use -pix_fmt yuv420p with NVENC if we are feeding it CUDA frames.
     # NVENC handles the pixel format natively on the GPU.
-    # if is_hybrid:
-    #     cmd.extend(["-pix_fmt", "yuv420p"])
+    # if needs_cpu:
+    #     output.extend(["-pix_fmt", "yuv420p"])
 
-    cmd.append(temp_out)
+    output.append(temp_out)
+    return inputs, graph, output
+
+
+def _is_gpu_oom(error: str) -> bool:
+    """Check whether an FFmpeg error message indicates CUDA/NVENC ran out of memory."""
+    error = error.lower()
+    return "out_of_memory" in error or "out of memory" in error
+
+
+def render_copy_batch(batch: List[tuple]) -> List[str]:
+    """
+    Stream-copy several segments with a single ffmpeg process.
+    Each segment gets its own seeked input and output, so gaps between
+    segments (e.g. cuts) are never read.
+    """
+    cmd = [FFMPEG_BIN, "-y"]
+    for args in batch:
+        seg, input_path = args[1], args[2]
+        cmd.extend(["-ss", str(seg.start), "-t", str(seg.duration), "-i", input_path])
+
+    temp_outs = []
+    for k, args in enumerate(batch):
+        i, temp_dir = args[0], args[3]
+        temp_out = _segment_output_path(temp_dir, i)
+        cmd.extend([
+            "-map", f"{k}:v:0",
+            "-map", f"{k}:a:0?",
+            "-c", "copy",
+            "-avoid_negative_ts", "make_zero",
+            temp_out,
+        ])
+        temp_outs.append(temp_out)
 
-    print(f"DEBUG: Running FFmpeg command for segment {i}:")
-    print(f"DEBUG: {' '.join(cmd)}")
-    
     run_ffmpeg(cmd, timeout=MAX_SEGMENT_TIMEOUT)
-    
-    if os.path.exists(temp_out):
-        size_mb = os.path.getsize(temp_out) / (1024 * 1024)
-        print(f"DEBUG: Segment {i} rendered. Size: {size_mb:.2f} MB")
-        
-    return temp_out
+    return temp_outs
+
+
+@lru_cache(maxsize=16)
+def _gpu_scale_filters(out_w: int, out_h: int, orig_w: int, orig_h: int, needs_cpu: bool) -> Tuple[str, ...]:
+    """
+    GPU scale step; the same for every segment of a job, so built once.
+    The scaler also emits NV12 for NVENC / hwdownload, so no separate format
+    conversion node is needed (e.g. for 10-bit sources).
+    """
+    if out_w != orig_w or out_h != orig_h:
+        if GPU_DOWNSCALE_NPP and out_w * out_h < orig_w * orig_h:
+            # NPP's supersampling is both faster and sharper for downscales
+            return (f"scale_npp={out_w}:{out_h}:interp_algo={GPU_DOWNSCALE_ALGO}:format=nv12",)
+        scale_filter = "scale_cuda" if USE_SCALE_CUDA else "scale_npp"
+        return (f"{scale_filter}={out_w}:{out_h}:interp_algo={GPU_SCALE_ALGO}:format=nv12",)
+    if needs_cpu:
+        # Passthrough for NV12 sources; converts e.g. P010 so hwdownload can hand back NV12
+        return ("scale_cuda=format=nv12",)
+    return ()
 
 
 def _build_gpu_filter_chain(
@@ -221,80 +448,91 @@ def _build_gpu_filter_chain(
     debug_overlay,
     seg_idx,
     reg_v,
-    is_paid,
-):
+    needs_cpu,
+) -> str:
     """
-    Safe GPU ↔ CPU filter chain for rendering segments.
+    Safe GPU ↔ CPU filter chain for rendering segments, as one comma-joined string.
 
     Rules:
     - GPU filters only receive CUDA frames
     - CPU filters only receive system memory frames
     - Handles scaling, effects, and debug overlay safely
+
+    Frames arrive in CUDA memory on both paths. needs_cpu must be the caller's
+    decision (it also accounts for the watermark, which reg_v alone does not show).
     """
 
-    gpu_filters: list[str] = []
-    needs_cpu = requires_cpu_filters(reg_v, debug_overlay)
+    # The debug drawtext is per segment, so only key the cache on it when it's in the chain
+    debug_idx = seg_idx if debug_overlay and needs_cpu else None
+    chain = _cached_filter_chain(out_w, out_h, orig_w, orig_h, tuple(reg_v), needs_cpu, debug_idx)
+
+    if PRINT_FFMPEG_OUTPUT:
+        kind = "Hybrid" if needs_cpu else "GPU"
+        print(f"DEBUG: {kind} Filter Chain for segment {seg_idx}: {chain}")
+    return chain
+
+
+@lru_cache(maxsize=256)
+def _cached_filter_chain(out_w: int, out_h: int, orig_w: int, orig_h: int,
+                         reg_v: Tuple[str, ...], needs_cpu: bool, debug_idx: Optional[int]) -> str:
+    """
+    The chain itself; segments with the same shape and effects (e.g. plain or
+    zoomed segments of one job) share a single built string.
+    """
+    # GPU scaling first on both paths, so a CPU excursion only moves output-sized frames
+    gpu_filters: list[str] = list(_gpu_scale_filters(out_w, out_h, orig_w, orig_h, needs_cpu))
 
     if needs_cpu:
         # ----------------------------
         # HYBRID: GPU → CPU → GPU
         # ----------------------------
-        # 🔑 We OMITTED -hwaccel_output_format cuda in the command,
-        # so frames arrive here in system memory (NV12 or similar).
+        # Download right before the CPU-only effects (Zoom, Subtitles, etc.).
+        # Effects are built for the output size, which the frames now have.
+        gpu_filters.append("hwdownload")
         gpu_filters.append("format=nv12")
-
-        # Check if we already have a scale/zoom in reg_v to avoid double scaling
-        has_manual_scale = any("scale=" in f for f in reg_v)
-
-        # CPU scaling if resolution changed AND no manual scale is present
-        if (out_w != orig_w or out_h != orig_h) and not has_manual_scale:
-            gpu_filters.append(f"scale={out_w}:{out_h}:flags=lanczos")
-
-        # Apply CPU-only video effects (Zoom, Subtitles, etc.)
         gpu_filters.extend(reg_v)
 
         # Debug overlay (optional)
-        if debug_overlay:
-            text = escape_filter_text(f"[{seg_idx}]")
-            gpu_filters.append(
-                f"drawtext=text='{text}':fontcolor=yellow:fontsize=20:"
-                "box=1:boxcolor=black@0.7:x=10:y=10"
-            )
+        if debug_idx is not None:
+            gpu_filters.append(_debug_drawtext(debug_idx))
 
         # Final CPU formatting
         gpu_filters.append("setsar=1")
         gpu_filters.append("format=nv12") # 🔑 KEY FIX: nv12 is required for stable hwupload_cuda
 
-        # Note: hwupload_cuda is now added in render_segment_smart 
+        # Note: hwupload_cuda is now added in _build_gpu_segment_parts
         # to allow watermark integration on CPU if needed.
-        
-        print(f"DEBUG: Hybrid Filter Chain for segment {seg_idx}: {gpu_filters}")
-        return gpu_filters
+        return ",".join(gpu_filters)
 
     # ----------------------------
     # PURE GPU: everything stays on GPU
     # ----------------------------
     # 🔑 Frames are already in CUDA due to -hwaccel_output_format cuda
-    # Adding hwupload_cuda here causes "Impossible to convert" errors.
-    gpu_filters.append("format=cuda")
-
-    # GPU scaling if resolution changed
-    if out_w != orig_w or out_h != orig_h:
-        scale_filter = "scale_cuda" if USE_SCALE_CUDA else "scale_npp"
-        gpu_filters.append(f"{scale_filter}={out_w}:{out_h}:interp_algo={GPU_SCALE_ALGO}")
+    # Adding hwupload_cuda here causes "Impossible to convert" errors,
+    # and a leading format=cuda is just an extra no-op node.
 
     # Apply pure GPU filters (must be GPU compatible)
     gpu_filters.extend(reg_v)
 
-    # Debug overlay not allowed here (would need CPU)
-    if debug_overlay:
-        print(f"⚠️  Warning: debug overlay requires CPU, skipping for segment {seg_idx}")
+    # Debug overlay is drawn from a pre-rendered label with overlay_cuda
+    # in _build_gpu_segment_parts, not as part of this chain
+
+    # SAR is set to 1:1 by the encoder-side metadata bitstream filter (see _SAR_BSF);
+    # setsar is a CPU filter and doesn't belong in a CUDA chain
+    return ",".join(gpu_filters) or "null"
 
-    # Ensure SAR is set for NVENC (only on CPU or if we have a GPU filter for it)
-    # gpu_filters.append("setsar=1") # REMOVED: setsar is a CPU filter
 
-    print(f"DEBUG: GPU Filter Chain for segment {seg_idx}: {gpu_filters}")
-    return gpu_filters
+# Filters known to accept CUDA frames (matched by filter name). Anything else is
+# assumed CPU-only and sends the segment down the hwdownload path: a CPU filter that
+# slips into a CUDA chain fails with "Impossible to convert between formats".
+# setpts/trim only touch timestamps, so speed edits stay on the GPU path; zoom (crop)
+# and captions (drawtext) have no CUDA equivalent in FFmpeg 7.1 and go hybrid.
+GPU_SAFE_FILTERS = frozenset(("setpts", "trim", "null"))
+GPU_SAFE_FILTER_SUFFIXES = ("_cuda", "_npp")
+
+# format= targets that may stay in a GPU chain
+# Note: format=nv12 is used in hybrid path, but here we check if it's in reg_v
+GPU_SAFE_FORMATS = frozenset(("cuda", "nv12"))
 
 
 def requires_cpu_filters(video_filters: list[str], debug_overlay: bool, watermark_path: str = None) -> bool:
@@ -302,50 +540,51 @@ def requires_cpu_filters(video_filters: list[str], debug_overlay: bool, watermar
     Determine if ANY filter requires CPU frames.
     This prevents illegal CUDA → CPU auto-conversions.
     """
-    # 🔑 CRITICAL: Watermarks with transparency currently require CPU overlay
-    if watermark_path:
+    # The watermark can be alpha-blended on GPU with overlay_cuda unless that's disabled
+    if watermark_path and not GPU_WATERMARK:
         return True
 
-    # Filters that are definitely CPU-only
-    CPU_ONLY_FILTERS = (
-        "drawtext",
-        "subtitles",
-        "eq",
-        "curves",
-        "color",
-        "hue",
-        "lut",
-    )
-
-    if debug_overlay:
+    # The debug label needs CPU drawtext only if it can't be pre-rendered for overlay_cuda
+    if debug_overlay and not can_render_labels():
         return True
 
-    for f in video_filters:
-        # Check for CPU-only filters
-        for kw in CPU_ONLY_FILTERS:
-            if kw in f:
+    # Many segments share the same filter list, so classify each distinct list once
+    return _filters_require_cpu(tuple(video_filters))
+
+
+@lru_cache(maxsize=64)
+def _filters_require_cpu(video_filters: Tuple[str, ...]) -> bool:
+    for chain in video_filters:
+        # Effects may contribute several comma-separated filters (e.g. zoom's crop+scale)
+        for f in chain.split(","):
+            name, _, opts = f.partition("=")
+            name = name.strip().rpartition("]")[2]  # drop any [label] prefix
+            if not name:
+                continue
+            if name == "format":
+                if opts not in GPU_SAFE_FORMATS:
+                    return True
+            elif name not in GPU_SAFE_FILTERS and not name.endswith(GPU_SAFE_FILTER_SUFFIXES):
                 return True
-        
-        # Check for software scale/crop/format (avoiding _cuda and _npp)
-        if "scale=" in f and "_cuda" not in f and "_npp" not in f:
-            return True
-        if "crop=" in f and "_cuda" not in f and "_npp" not in f:
-            return True
-        if "format=" in f and "format=cuda" not in f and "format=nv12" not in f:
-            # Note: format=nv12 is used in hybrid path, but here we check if it's in reg_v
-            return True
-        if "setpts" in f: # setpts is usually CPU, though there might be GPU variants
-            return True
-        if "setsar" in f:
-            return True
 
     return False
 
 
+@lru_cache(maxsize=None)
+def _debug_drawtext(seg_idx: int) -> str:
+    """CPU drawtext filter for the "[i]" debug label (segment indices repeat across jobs)."""
+    text = escape_filter_text(f"[{seg_idx}]")
+    return (
+        f"drawtext=text='{text}':fontcolor=yellow:fontsize=20:"
+        "box=1:boxcolor=black@0.7:x=10:y=10"
+    )
+
+
 def _render_cpu_fallback(args, temp_out):
     """CPU fallback when GPU is unavailable."""
     (i, seg, input_path, temp_dir, fps, debug_overlay, has_audio,
-     orig_w, orig_h, out_w, out_h) = args
+     orig_w, orig_h, out_w, out_h, is_paid, watermark_path, seg_cq,
+     reg_v, reg_a, needs_cpu, audio_codec, video_codec) = args
     
     cmd = [FFMPEG_BIN, "-y", "-ss", str(seg.start), "-t", str(seg.duration), 
            "-i", input_path]
@@ -354,15 +593,10 @@ def _render_cpu_fallback(args, temp_out):
     if out_w != orig_w or out_h != orig_h:
         v_filters.append(f"scale={out_w}:{out_h}:flags=fast_bilinear")
     
-    reg_v, reg_a = get_segment_filters(seg, out_w, out_h, has_audio)
     v_filters.extend(reg_v)
     
     if debug_overlay:
-        text = escape_filter_text(f"[{i}]")
-        v_filters.append(
-            f"drawtext=text='{text}':fontcolor=yellow:fontsize=20:"
-            f"box=1:boxcolor=black@0.7:x=10:y=10"
-        )
+        v_filters.append(_debug_drawtext(i))
     
     v_filters.append("setsar=1")
     v_filters.append("format=yuv420p")
@@ -373,14 +607,13 @@ def _render_cpu_fallback(args, temp_out):
     else:
         cmd.extend(["-vf", ",".join(v_filters)])
         if has_audio:
-            cmd.extend(["-map", "0:v:0", "-map", "0:a:0", "-c:a", "aac", "-b:a", AUDIO_BITRATE])
+            cmd.extend(["-map", "0:v:0", "-map", "0:a:0", *_passthrough_audio_args(audio_codec)])
     
     cmd.extend([
         "-c:v", "libx264",
         "-preset", ENCODING_PRESET,
         "-crf", str(CRF_QUALITY),
         "-pix_fmt", "yuv420p",
-        "-movflags", "+faststart",
         "-vsync", "cfr",
         temp_out
     ])
@@ -1,4 +1,5 @@
-from typing import List, Set
+from collections import defaultdict
+from typing import Dict, List, Set
 from models import Edit, Subtitle, Segment
 from processor.analyzer import analyze_segment_processing
 
@@ -16,22 +17,50 @@ def create_segments(edits: List[Edit], subtitles: List[Subtitle],
     sorted_points = sorted(list(boundaries))
     segments: List[Segment] = []
     
-    # 2. Helper to check if a range is inside a 'cut'
-    def is_cut(start: float, end: float) -> bool:
-        for e in edits:
-            if e.type == "cut" and not (end <= e.start or start >= e.end):
-                return True
-        return False
+    # 2. Every clamped edit start/end is a boundary, so each interval between two
+    #    points lies either fully inside or fully outside an edit. Sweep once,
+    #    keeping the edits active at the current point.
+    starts_at: Dict[float, List[int]] = defaultdict(list)
+    ends_at: Dict[float, List[int]] = defaultdict(list)
+    for idx, e in enumerate(edits):
+        e_start = max(0.0, min(e.start, total_duration))
+        e_end = max(0.0, min(e.end, total_duration))
+        if e_end > e_start:
+            starts_at[e_start].append(idx)
+            ends_at[e_end].append(idx)
+    active_cuts = 0
+    active_edits: Set[int] = set()  # indices, so the first listed edit wins on overlap
+    
+    # Subtitles don't split segments; sweep them by start time instead
+    subs_by_start = sorted(range(len(subtitles)), key=lambda k: subtitles[k].start)
+    next_sub = 0
+    open_subs: List[int] = []
 
     # 3. Create segments between boundaries
     for i in range(len(sorted_points) - 1):
         start, end = sorted_points[i], sorted_points[i+1]
-        if end - start < 0.001 or is_cut(start, end):
+        for idx in ends_at.get(start, ()):
+            if edits[idx].type == "cut":
+                active_cuts -= 1
+            else:
+                active_edits.discard(idx)
+        for idx in starts_at.get(start, ()):
+            if edits[idx].type == "cut":
+                active_cuts += 1
+            else:
+                active_edits.add(idx)
+
+        while next_sub < len(subs_by_start) and subtitles[subs_by_start[next_sub]].start < end:
+            open_subs.append(subs_by_start[next_sub])
+            next_sub += 1
+        open_subs = [k for k in open_subs if subtitles[k].end > start]
+
+        if end - start < 0.001 or active_cuts:
             continue
             
         # Find active edit and overlapping subtitles
-        active_edit = next((e for e in edits if e.type != "cut" and not (end <= e.start or start >= e.end)), None)
-        overlapping_subs = [s for s in subtitles if not (s.end <= start or s.start >= end)]
+        active_edit = edits[min(active_edits)] if active_edits else None
+        overlapping_subs = [subtitles[k] for k in sorted(open_subs)]
         
         seg = Segment(
             end=end,
@@ -1,13 +1,23 @@
+import os
+import time
+import threading
 import requests
+from typing import Optional
+from concurrent.futures import ThreadPoolExecutor
+from config import DOWNLOAD_CONNECTIONS, DOWNLOAD_PARALLEL_MIN_MB
 from storage.gdrive import download_from_gdrive
+from storage.session import SESSION
 from utils.retry import retry
 
+_PROGRESS_INTERVAL = 0.05  # At most 20 progress lines per second
+_last_progress = 0.0
+
 
 @retry(requests.exceptions.RequestException, tries=3, delay=2, backoff=2)
 def download_file(
     url: str,
     output_path: str,
-    chunk_size: int = 8192,
+    chunk_size: int = 1024 * 1024,
     timeout: int = 60,
 ):
     """
@@ -38,10 +48,25 @@ def download_file(
         return
 
     # --- Standard HTTP(S) download ---
+    # Ask for one byte first (not HEAD: presigned URLs are only signed for GET).
+    # A server that ignores Range answers 200 with the whole file, which we just keep reading.
     # Use a shorter connect timeout and longer read timeout
-    response = requests.get(url, stream=True, timeout=(10, timeout))
+    response = SESSION.get(url, headers={"Range": "bytes=0-0"}, stream=True, timeout=(10, timeout))
     response.raise_for_status()
 
+    if response.status_code == 206:
+        response.close()
+        total_size = _range_total(response)
+        if total_size and total_size >= DOWNLOAD_PARALLEL_MIN_MB * 1024 * 1024:
+            print(f"[DOWNLOAD] File size: {total_size / (1024 * 1024):.2f} MB")
+            print(f"[DOWNLOAD] Fetching in {DOWNLOAD_CONNECTIONS} parallel ranges")
+            _download_ranges(url, output_path, total_size, chunk_size, timeout)
+            print("\n[DOWNLOAD] Download completed successfully")
+            return
+
+        response = SESSION.get(url, stream=True, timeout=(10, timeout))
+        response.raise_for_status()
+
     total_size = int(response.headers.get("Content-Length", 0))
     downloaded = 0
 
@@ -59,12 +84,72 @@ def download_file(
             downloaded += len(chunk)
 
             if total_size:
-                percent = (downloaded / total_size) * 100
-                print(
-                    f"\r[DOWNLOAD] {percent:6.2f}% "
-                    f"({downloaded / (1024 * 1024):.2f} MB)",
-                    end="",
-                    flush=True,
-                )
-
-    print("\n[DOWNLOAD] Download completed successfully")
\ No newline at end of file
+                _print_progress(downloaded, total_size)
+
+    print("\n[DOWNLOAD] Download completed successfully")
+
+
+def _print_progress(downloaded: int, total_size: int):
+    global _last_progress
+    now = time.monotonic()
+    if downloaded < total_size and now - _last_progress < _PROGRESS_INTERVAL:
+        return
+    _last_progress = now
+
+    percent = (downloaded / total_size) * 100
+    print(
+        f"\r[DOWNLOAD] {percent:6.2f}% "
+        f"({downloaded / (1024 * 1024):.2f} MB)",
+        end="",
+        flush=True,
+    )
+
+
+def _range_total(response: requests.Response) -> Optional[int]:
+    """Total size from a 206 response's "Content-Range: bytes 0-0/<total>" header."""
+    content_range = response.headers.get("Content-Range", "")
+    total = content_range.rsplit("/", 1)[-1]
+    return int(total) if total.isdigit() else None
+
+
+def _download_ranges(url: str, output_path: str, total_size: int, chunk_size: int, timeout: int):
+    """Fetch the file as DOWNLOAD_CONNECTIONS byte ranges written in place with pwrite."""
+    part_size = -(-total_size // DOWNLOAD_CONNECTIONS)
+    ranges = [(start, min(start + part_size, total_size)) for start in range(0, total_size, part_size)]
+    downloaded = 0
+    lock = threading.Lock()
+
+    def fetch(start: int, end: int):
+        nonlocal downloaded
+        response = SESSION.get(
+            url, headers={"Range": f"bytes={start}-{end - 1}"}, stream=True, timeout=(10, timeout)
+        )
+        response.raise_for_status()
+        if response.status_code != 206:
+            raise requests.exceptions.RequestException(f"Range request not honoured (HTTP {response.status_code})")
+
+        offset = start
+        for chunk in response.iter_content(chunk_size=chunk_size):
+            if not chunk:
+                continue
+            os.pwrite(fd, chunk, offset)
+            offset += len(chunk)
+            with lock:
+                downloaded += len(chunk)
+                _print_progress(downloaded, total_size)
+
+        if offset != end:
+            raise requests.exceptions.RequestException(f"Range {start}-{end - 1} ended early at {offset}")
+
+    fd = os.open(output_path, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o644)
+    try:
+        if hasattr(os, "posix_fallocate"):
+            os.posix_fallocate(fd, 0, total_size)
+        else:
+            os.ftruncate(fd, total_size)
+
+        with ThreadPoolExecutor(max_workers=len(ranges)) as executor:
+            for future in [executor.submit(fetch, start, end) for start, end in ranges]:
+                future.result()
+    finally:
+        os.close(fd)
@@ -1,27 +1,64 @@
 import os
-import json
-import subprocess
-from typing import Optional, Dict, Any
+import uuid
+from typing import Optional, Dict, Any, Iterator
+from storage.session import SESSION
 from utils.retry import retry
 
+
+class _MultipartFileBody:
+    """
+    multipart/form-data body with a single file field, streamed from disk.
+    Has a length, so requests sends a Content-Length instead of chunked encoding,
+    and never holds more than one chunk of the file in memory.
+    """
+
+    def __init__(self, file_path: str, field: str = "file", chunk_size: int = 1024 * 1024):
+        self.file_path = file_path
+        self.chunk_size = chunk_size
+        self.boundary = uuid.uuid4().hex
+        filename = os.path.basename(file_path).replace('"', "")
+        self.head = (
+            f"--{self.boundary}\r\n"
+            f'Content-Disposition: form-data; name="{field}"; filename="{filename}"\r\n'
+            "Content-Type: application/octet-stream\r\n\r\n"
+        ).encode()
+        self.tail = f"\r\n--{self.boundary}--\r\n".encode()
+        self.file_size = os.path.getsize(file_path)
+
+    @property
+    def content_type(self) -> str:
+        return f"multipart/form-data; boundary={self.boundary}"
+
+    def __len__(self) -> int:
+        return len(self.head) + self.file_size + len(self.tail)
+
+    def __iter__(self) -> Iterator[bytes]:
+        yield self.head
+        with open(self.file_path, "rb") as f:
+            if hasattr(os, "posix_fadvise"):
+                os.posix_fadvise(f.fileno(), 0, 0, os.POSIX_FADV_SEQUENTIAL)
+            for chunk in iter(lambda: f.read(self.chunk_size), b""):
+                yield chunk
+        yield self.tail
+
+
 @retry(Exception, tries=2, delay=5, backoff=2)
 def upload_to_gofile(file_path: str, api_token: Optional[str] = None) -> Dict[str, Any]:
     """Upload file to Gofile with retry logic."""
     if not os.path.exists(file_path):
         return {"error": "File not found"}
-    
+
     try:
         url = "https://upload.gofile.io/uploadfile"
-        cmd = ["curl", "-F", f"file=@{file_path}"]
+        body = _MultipartFileBody(file_path)
+        headers = {"Content-Type": body.content_type}
         if api_token:
-            cmd.extend(["-H", f"Authorization: Bearer {api_token}"])
-        cmd.append(url)
-        
-        result = subprocess.run(cmd, capture_output=True, text=True, timeout=600)
-        if result.returncode != 0:
-            raise RuntimeError(f"Curl failed: {result.stderr}")
-            
-        response = json.loads(result.stdout)
+            headers["Authorization"] = f"Bearer {api_token}"
+
+        result = SESSION.post(url, data=body, headers=headers, timeout=(10, 600))
+        result.raise_for_status()
+
+        response = result.json()
         if response.get("status") == "ok":
             return {"success": True, "download_url": response["data"]["downloadPage"]}
         return {"error": response.get("status")}
@@ -0,0 +1,26 @@
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+from config import DOWNLOAD_CONNECTIONS
+
+# One pooled keep-alive session for every storage helper, so retries and parallel
+# range requests reuse open connections instead of paying a TCP+TLS handshake each.
+# Connection failures (nothing sent yet) are retried here for every method; 5xx
+# answers only for GET, since a streamed upload body can't be replayed by urllib3.
+# Whole-transfer failures are still retried by the @retry decorators.
+_RETRY = Retry(
+    total=3,
+    backoff_factor=1,
+    status_forcelist=(502, 503, 504),
+    allowed_methods=frozenset({"GET"}),
+    raise_on_status=False,
+)
+
+SESSION = requests.Session()
+_adapter = HTTPAdapter(
+    pool_connections=16,
+    pool_maxsize=max(16, DOWNLOAD_CONNECTIONS),
+    max_retries=_RETRY,
+)
+SESSION.mount("https://", _adapter)
+SESSION.mount("http://", _adapter)
@@ -1,26 +1,87 @@
 import os
+import json
+import atexit
+import shutil
+import hashlib
+import threading
 import subprocess
 import re
+from functools import wraps
+from concurrent.futures import ThreadPoolExecutor
 from typing import Dict, Optional, Tuple
 from config import (
-    FFMPEG_BIN, GPU_ENCODER, GPU_DECODER, 
-    ENABLE_GPU_MONITORING, PRINT_FFMPEG_OUTPUT
+    ENABLE_GPU, FFMPEG_BIN, GPU_PROBE_CACHE, GPU_ENCODER, GPU_DECODER, 
+    ENABLE_GPU_MONITORING, PRINT_FFMPEG_OUTPUT,
+    DECODER_SURFACES, EXTRA_HW_FRAMES, NVENC_SURFACES
 )
 
 # Cache for GPU support check
 _GPU_SUPPORT_CACHE = None
 _GPU_INFO_CACHE = None
+_CUVID_DECODERS = frozenset()  # Filled in by the FFmpeg support check
+_NVML_HANDLE = None  # NVML handle of GPU 0, or False when NVML isn't usable
+_HAS_NVIDIA_SMI = None
+_FFMPEG_COMPONENTS = {}  # kind -> names from a successful `ffmpeg -<kind>` listing
 
+# Concurrent first callers wait for the one probe in flight instead of starting their own
+_GPU_SUPPORT_LOCK = threading.Lock()
+_GPU_INFO_LOCK = threading.Lock()
+
+
+def _reset_after_fork():
+    """
+    In a forked child: NVML handles don't survive fork, GPU info may differ (e.g. another
+    MIG slice), and a lock held by another parent thread would never be released.
+    The probe result itself still holds (same machine, same FFmpeg), so it is kept.
+    """
+    global _NVML_HANDLE, _GPU_INFO_CACHE, _GPU_SUPPORT_LOCK, _GPU_INFO_LOCK
+    _NVML_HANDLE = None
+    _GPU_INFO_CACHE = None
+    _GPU_SUPPORT_LOCK = threading.Lock()
+    _GPU_INFO_LOCK = threading.Lock()
+
+
+if hasattr(os, "register_at_fork"):
+    os.register_at_fork(after_in_child=_reset_after_fork)
+
+
+def requires_gpu(default):
+    """
+    Return `default` straight away when GPU processing is disabled (ENABLE_GPU)
+    or the host has no nvidia-smi, instead of probing for a GPU that isn't there.
+    """
+    def decorator(fn):
+        @wraps(fn)
+        def wrapper(*args, **kwargs):
+            global _HAS_NVIDIA_SMI
+            if _HAS_NVIDIA_SMI is None:
+                _HAS_NVIDIA_SMI = shutil.which("nvidia-smi") is not None
+            if not ENABLE_GPU or not _HAS_NVIDIA_SMI:
+                return default
+            return fn(*args, **kwargs)
+        return wrapper
+    return decorator
+
+
+@requires_gpu(False)
 def check_gpu_support() -> bool:
     """
     Comprehensive check if NVIDIA GPU hardware acceleration is available and working.
     Tests: CUDA driver, encoder, decoder, and scale_cuda filter.
     """
-    global _GPU_SUPPORT_CACHE
-    
     if _GPU_SUPPORT_CACHE is not None:
         return _GPU_SUPPORT_CACHE
     
+    with _GPU_SUPPORT_LOCK:
+        if _GPU_SUPPORT_CACHE is None:
+            _probe_gpu_support()
+    return _GPU_SUPPORT_CACHE
+
+
+def _probe_gpu_support():
+    """Run the checks below once and store the outcome in _GPU_SUPPORT_CACHE."""
+    global _GPU_SUPPORT_CACHE, _CUVID_DECODERS
+    
     try:
         log("Starting comprehensive GPU support check...")
         
@@ -36,6 +97,15 @@ def check_gpu_support() -> bool:
             _GPU_SUPPORT_CACHE = False
             return False
         
+        # Same GPU, driver and FFmpeg build as a previous successful probe: skip steps 3-4
+        probe_key = _probe_cache_key()
+        cached_decoders = _load_probe_cache(probe_key)
+        if cached_decoders is not None:
+            _CUVID_DECODERS = frozenset(cached_decoders)
+            log("✓ GPU hardware acceleration confirmed by cached probe")
+            _GPU_SUPPORT_CACHE = True
+            return True
+        
         # Step 3: Check FFmpeg GPU support
         if not _check_ffmpeg_gpu_support():
             log("❌ FFmpeg GPU support not available")
@@ -49,6 +119,7 @@ def check_gpu_support() -> bool:
             return False
         
         log("✓ GPU hardware acceleration fully operational")
+        _save_probe_cache(probe_key)
         _GPU_SUPPORT_CACHE = True
         return True
         
@@ -58,71 +129,112 @@ def check_gpu_support() -> bool:
         return False
 
 
+def _probe_cache_key() -> Optional[str]:
+    """What a cached probe result depends on: GPU, driver, FFmpeg binary and codecs."""
+    ffmpeg_path = shutil.which(FFMPEG_BIN)
+    if not GPU_PROBE_CACHE or not ffmpeg_path:
+        return None
+    info = get_gpu_info()
+    raw = (
+        f"{info.get('name')}|{info.get('driver_version')}|"
+        f"{ffmpeg_path}|{os.path.getmtime(ffmpeg_path)}|{GPU_ENCODER}|{GPU_DECODER}"
+    )
+    return hashlib.sha1(raw.encode()).hexdigest()
+
+
+def _load_probe_cache(key: Optional[str]) -> Optional[list]:
+    """CUVID decoders recorded by a successful probe with the same key, else None."""
+    if not key:
+        return None
+    try:
+        with open(GPU_PROBE_CACHE) as f:
+            data = json.load(f)
+    except (OSError, ValueError):
+        return None
+    if data.get("key") != key or not data.get("ok"):
+        return None
+    return data.get("cuvid_decoders", [])
+
+
+def _save_probe_cache(key: Optional[str]):
+    """Record a successful probe (atomically, so concurrent workers never read half a file)."""
+    if not key:
+        return
+    try:
+        os.makedirs(os.path.dirname(GPU_PROBE_CACHE), exist_ok=True)
+        tmp_path = f"{GPU_PROBE_CACHE}.{os.getpid()}.tmp"
+        with open(tmp_path, "w") as f:
+            json.dump({"key": key, "ok": True, "cuvid_decoders": sorted(_CUVID_DECODERS)}, f)
+        os.replace(tmp_path, GPU_PROBE_CACHE)
+    except OSError as e:
+        log(f"⚠️  Could not cache GPU probe result: {e}")
+
+
 def _check_nvidia_driver() -> bool:
     """Check if NVIDIA driver is loaded and working."""
-    try:
-        result = subprocess.run(
-            ["nvidia-smi", "-L"],
-            capture_output=True,
-            text=True,
-            timeout=5
-        )
-        
-        if result.returncode == 0 and result.stdout.strip():
-            gpu_name = result.stdout.strip().split('\n')[0]
-            log(f"✓ NVIDIA driver detected: {gpu_name}")
-            return True
-        
-        return False
-    except (subprocess.TimeoutExpired, FileNotFoundError, Exception):
+    # Same single nvidia-smi query as get_gpu_info (cached), not a separate `nvidia-smi -L`
+    info = get_gpu_info()
+    if not info:
         return False
 
+    log(f"✓ NVIDIA driver detected: {info['name']}")
+    return True
+
 
 def _check_cuda_available() -> bool:
     """Check if CUDA is available in the system."""
-    try:
-        # Check CUDA version
-        result = subprocess.run(
-            ["nvidia-smi", "--query-gpu=driver_version", "--format=csv,noheader"],
-            capture_output=True,
-            text=True,
-            timeout=5
-        )
-        
-        if result.returncode == 0:
-            driver_version = result.stdout.strip()
-            log(f"✓ CUDA available (Driver: {driver_version})")
-            
-            # Set CUDA environment if not already set
-            if not os.environ.get("CUDA_VISIBLE_DEVICES"):
-                os.environ["CUDA_VISIBLE_DEVICES"] = "0"
-                log("  Set CUDA_VISIBLE_DEVICES=0")
-            
-            return True
-        
-        return False
-    except Exception:
+    info = get_gpu_info()
+    if not info:
         return False
 
+    log(f"✓ CUDA available (Driver: {info['driver_version']})")
+
+    # Set CUDA environment if not already set
+    if not os.environ.get("CUDA_VISIBLE_DEVICES"):
+        os.environ["CUDA_VISIBLE_DEVICES"] = "0"
+        log("  Set CUDA_VISIBLE_DEVICES=0")
+
+    return True
+
+
+def _ffmpeg_components(kind: str) -> Optional[frozenset]:
+    """
+    Names listed by `ffmpeg -hide_banner -<kind>` (encoders, decoders, filters).
+    Successful listings are kept for the process; None (FFmpeg couldn't list them)
+    is not, so a transient failure is retried on the next call.
+    """
+    if kind in _FFMPEG_COMPONENTS:
+        return _FFMPEG_COMPONENTS[kind]
+
+    result = subprocess.run(
+        [FFMPEG_BIN, "-hide_banner", f"-{kind}"],
+        capture_output=True,
+        text=True,
+        timeout=10
+    )
+    if result.returncode != 0:
+        return None
+    
+    # Rows are "<flags> <name> <description>"
+    names = frozenset(
+        parts[1] for parts in (line.split() for line in result.stdout.splitlines()) if len(parts) >= 2
+    )
+    _FFMPEG_COMPONENTS[kind] = names
+    return names
+
 
 def _check_ffmpeg_gpu_support() -> bool:
     """Verify FFmpeg was compiled with NVENC/NVDEC support."""
     try:
         # Check for encoder
-        result_enc = subprocess.run(
-            [FFMPEG_BIN, "-hide_banner", "-encoders"],
-            capture_output=True,
-            text=True,
-            timeout=10
-        )
-        
-        if result_enc.returncode != 0:
+        encoders = _ffmpeg_components("encoders")
+        if encoders is None:
             log(f"❌ Failed to query FFmpeg encoders")
             return False
         
         # Check for all NVENC variants
         nvenc_variants = ["h264_nvenc", "hevc_nvenc", "av1_nvenc"]
-        found_encoders = [enc for enc in nvenc_variants if enc in result_enc.stdout]
+        found_encoders = [enc for enc in nvenc_variants if enc in encoders]
         
         if not found_encoders:
             log(f"❌ No NVENC encoders found in FFmpeg")
@@ -131,33 +243,29 @@ def _check_ffmpeg_gpu_support() -> bool:
         log(f"✓ Found NVENC encoders: {', '.join(found_encoders)}")
         
         # Check for decoder
-        result_dec = subprocess.run(
-            [FFMPEG_BIN, "-hide_banner", "-decoders"],
-            capture_output=True,
-            text=True,
-            timeout=10
-        )
-        
-        if result_dec.returncode != 0:
+        decoders = _ffmpeg_components("decoders")
+        if decoders is None:
             log(f"❌ Failed to query FFmpeg decoders")
             return False
         
         # Check for all CUVID variants
         cuvid_variants = ["h264_cuvid", "hevc_cuvid", "vp9_cuvid", "av1_cuvid"]
-        found_decoders = [dec for dec in cuvid_variants if dec in result_dec.stdout]
+        found_decoders = [dec for dec in cuvid_variants if dec in decoders]
         
         if not found_decoders:
             log(f"❌ No CUVID decoders found in FFmpeg")
             return False
         
         log(f"✓ Found CUVID decoders: {', '.join(found_decoders)}")
+        global _CUVID_DECODERS
+        _CUVID_DECODERS = frozenset(found_decoders)
         
         # Verify specific encoder and decoder from config
-        if GPU_ENCODER not in result_enc.stdout:
+        if GPU_ENCODER not in encoders:
             log(f"❌ Configured encoder '{GPU_ENCODER}' not found")
             return False
         
-        if GPU_DECODER not in result_dec.stdout:
+        if GPU_DECODER not in decoders:
             log(f"❌ Configured decoder '{GPU_DECODER}' not found")
             return False
         
@@ -172,55 +280,50 @@ def _check_ffmpeg_gpu_support() -> bool:
 def _test_hardware_acceleration() -> bool:
     """
     Run hardware acceleration test.
-    Tests GPU encoder first (most reliable), then full pipeline.
+    Tests GPU encoder (most reliable) and the full pipeline; the two tiny
+    encodes are independent, so they run side by side.
     """
+    # Test 1: GPU encoder (most reliable test - no CUDA filters)
+    encoder_test = [
+        FFMPEG_BIN, "-y",
+        "-f", "lavfi", "-i", "testsrc=duration=0.5:size=640x480:rate=30",
+        "-c:v", GPU_ENCODER,
+        "-preset", "p4",
+        "-f", "null", "-"
+    ]
+    
+    # Test 2: Full GPU pipeline with proper hwupload
+    # testsrc outputs CPU frames, so we need hwupload_cuda before scale_cuda
+    pipeline_test = [
+        FFMPEG_BIN, "-y",
+        "-f", "lavfi", "-i", "testsrc=duration=0.5:size=640x480:rate=30",
+        "-vf", "format=nv12,hwupload_cuda,scale_cuda=320:240",
+        "-c:v", GPU_ENCODER,
+        "-preset", "p4",
+        "-f", "null", "-"
+    ]
+    
     try:
-        # Test 1: GPU encoder (most reliable test - no CUDA filters)
-        log("Testing GPU encoder...")
-        
-        encoder_test = [
-            FFMPEG_BIN, "-y",
-            "-f", "lavfi", "-i", "testsrc=duration=0.5:size=640x480:rate=30",
-            "-c:v", GPU_ENCODER,
-            "-preset", "p4",
-            "-f", "null", "-"
-        ]
-        
-        result = subprocess.run(
-            encoder_test,
-            capture_output=True,
-            text=True,
-            timeout=10
-        )
+        log("Testing GPU encoder and full GPU pipeline (hwupload → scale_cuda → encode)...")
+        
+        with ThreadPoolExecutor(max_workers=2) as executor:
+            encoder_future = executor.submit(
+                subprocess.run, encoder_test, stdout=subprocess.DEVNULL, stderr=subprocess.PIPE, timeout=10
+            )
+            pipeline_future = executor.submit(
+                subprocess.run, pipeline_test, stdout=subprocess.DEVNULL, stderr=subprocess.PIPE, timeout=15
+            )
+            result = encoder_future.result()
+            result2 = pipeline_future.result()
         
         if result.returncode != 0:
             log("❌ GPU encoder test failed")
             if PRINT_FFMPEG_OUTPUT:
-                log(f"Encoder test stderr:\n{result.stderr}")
+                log(f"Encoder test stderr:\n{result.stderr.decode(errors='replace')}")
             return False
         
         log("✓ GPU encoder works")
         
-        # Test 2: Full GPU pipeline with proper hwupload
-        # testsrc outputs CPU frames, so we need hwupload_cuda before scale_cuda
-        log("Testing full GPU pipeline (hwupload → scale_cuda → encode)...")
-        
-        pipeline_test = [
-            FFMPEG_BIN, "-y",
-            "-f", "lavfi", "-i", "testsrc=duration=0.5:size=640x480:rate=30",
-            "-vf", "format=nv12,hwupload_cuda,scale_cuda=320:240",
-            "-c:v", GPU_ENCODER,
-            "-preset", "p4",
-            "-f", "null", "-"
-        ]
-        
-        result2 = subprocess.run(
-            pipeline_test,
-            capture_output=True,
-            text=True,
-            timeout=15
-        )
-        
         if result2.returncode == 0:
             log("✓ Full GPU pipeline test passed (hwupload → scale_cuda → encode)")
             return True
@@ -230,7 +333,7 @@ def _test_hardware_acceleration() -> bool:
             log("⚠️  scale_cuda not working, but encoder is functional")
             log("   Renderer will use CPU scaling with GPU encoding")
             if PRINT_FFMPEG_OUTPUT:
-                log(f"Pipeline test stderr:\n{result2.stderr}")
+                log(f"Pipeline test stderr:\n{result2.stderr.decode(errors='replace')}")
             return True  # Return True since encoder works
             
     except subprocess.TimeoutExpired:
@@ -241,18 +344,30 @@ def _test_hardware_acceleration() -> bool:
         return False
 
 
+@requires_gpu({})
 def get_gpu_info() -> Dict[str, any]:
-    """Get detailed GPU information."""
-    global _GPU_INFO_CACHE
-    
+    """
+    Get detailed GPU information.
+    One nvidia-smi query, cached; the driver and CUDA checks read from it too.
+    """
     if _GPU_INFO_CACHE is not None:
         return _GPU_INFO_CACHE
     
+    with _GPU_INFO_LOCK:
+        if _GPU_INFO_CACHE is None:
+            _query_gpu_info()
+    return _GPU_INFO_CACHE
+
+
+def _query_gpu_info():
+    """Run the nvidia-smi query and store the parsed result in _GPU_INFO_CACHE."""
+    global _GPU_INFO_CACHE
+    
     try:
         result = subprocess.run(
             [
                 "nvidia-smi",
-                "--query-gpu=name,memory.total,memory.free,memory.used,compute_cap,driver_version,pcie.link.gen.current,pcie.link.width.current",
+                "--query-gpu=name,memory.total,compute_cap,driver_version,pcie.link.gen.current,pcie.link.width.current",
                 "--format=csv,noheader,nounits"
             ],
             capture_output=True,
@@ -261,19 +376,24 @@ def get_gpu_info() -> Dict[str, any]:
         )
         
         if result.returncode != 0:
-            return {}
+            _GPU_INFO_CACHE = {}
+            return _GPU_INFO_CACHE
         
-        parts = [p.strip() for p in result.stdout.strip().split(",")]
+        # One line per GPU; we render on the first one
+        lines = result.stdout.strip().splitlines()
+        if not lines:
+            _GPU_INFO_CACHE = {}
+            return _GPU_INFO_CACHE
+        parts = [p.strip() for p in lines[0].split(",")]
         
+        # Static fields only; free/used VRAM changes over time (see get_free_vram_mb)
         info = {
             "name": parts[0],
             "total_memory_mb": int(float(parts[1])),
-            "free_memory_mb": int(float(parts[2])),
-            "used_memory_mb": int(float(parts[3])),
-            "compute_capability": parts[4],
-            "driver_version": parts[5],
-            "pcie_gen": int(parts[6]) if len(parts) > 6 else 0,
-            "pcie_width": int(parts[7]) if len(parts) > 7 else 0,
+            "compute_capability": parts[2],
+            "driver_version": parts[3],
+            "pcie_gen": int(parts[4]) if len(parts) > 4 else 0,
+            "pcie_width": int(parts[5]) if len(parts) > 5 else 0,
         }
         
         _GPU_INFO_CACHE = info
@@ -281,7 +401,14 @@ def get_gpu_info() -> Dict[str, any]:
         
     except Exception as e:
         log(f"Failed to get GPU info: {e}")
-        return {}
+        # Cache the miss too, so GPU-less hosts don't re-run nvidia-smi on every call
+        _GPU_INFO_CACHE = {}
+        return _GPU_INFO_CACHE
+
+
+def get_cuvid_decoders() -> frozenset:
+    """CUVID decoders found by check_gpu_support() (empty until it has run)."""
+    return _CUVID_DECODERS
 
 
 def get_gpu_compute_capability() -> Optional[str]:
@@ -351,8 +478,101 @@ def get_optimal_nvenc_settings() -> Dict[str, any]:
         }
 
 
+def estimate_vram_per_worker(width: int, height: int) -> int:
+    """
+    Estimate VRAM (MB) used by one NVDEC+NVENC segment worker at the given resolution.
+    Counts NV12 frames held by the decoder, extra hw frames and encoder surfaces,
+    plus a fixed CUDA context overhead.
+    """
+    frame_mb = width * height * 1.5 / (1024 * 1024)
+    frames = DECODER_SURFACES + EXTRA_HW_FRAMES + NVENC_SURFACES
+    return int(frame_mb * frames) + 300
+
+
+def _nvml_handle():
+    """NVML handle for GPU 0, initialised once (None without pynvml or a driver)."""
+    global _NVML_HANDLE
+
+    if _NVML_HANDLE is None:
+        try:
+            import pynvml
+            pynvml.nvmlInit()
+            atexit.register(_nvml_shutdown, os.getpid())
+            _NVML_HANDLE = pynvml.nvmlDeviceGetHandleByIndex(0)
+        except Exception:
+            _NVML_HANDLE = False
+    return _NVML_HANDLE or None
+
+
+def _nvml_shutdown(owner_pid: int):
+    """atexit hook; forked children inherit it but must not shut down the parent's NVML."""
+    if os.getpid() != owner_pid:
+        return
+    try:
+        import pynvml
+        pynvml.nvmlShutdown()
+    except Exception:
+        pass
+
+
+def _monitor_gpu_usage_nvml(handle) -> Dict[str, any]:
+    """Same fields as the nvidia-smi query, read in-process through NVML."""
+    import pynvml
+
+    util = pynvml.nvmlDeviceGetUtilizationRates(handle)
+    memory = pynvml.nvmlDeviceGetMemoryInfo(handle)
+    return {
+        "gpu_util": util.gpu,
+        "encoder_util": pynvml.nvmlDeviceGetEncoderUtilization(handle)[0],
+        "decoder_util": pynvml.nvmlDeviceGetDecoderUtilization(handle)[0],
+        "memory_used_mb": memory.used // (1024 * 1024),
+        "memory_total_mb": memory.total // (1024 * 1024),
+        "temperature_c": pynvml.nvmlDeviceGetTemperature(handle, pynvml.NVML_TEMPERATURE_GPU),
+        "power_draw_w": pynvml.nvmlDeviceGetPowerUsage(handle) / 1000.0,
+    }
+
+
+@requires_gpu(None)
+def get_free_vram_mb() -> Optional[int]:
+    """
+    Free VRAM (MB) right now. Unlike get_gpu_info (cached static fields),
+    this is read fresh on every call: other processes come and go between jobs.
+    """
+    handle = _nvml_handle()
+    if handle:
+        try:
+            import pynvml
+            return pynvml.nvmlDeviceGetMemoryInfo(handle).free // (1024 * 1024)
+        except Exception:
+            pass
+
+    try:
+        result = subprocess.run(
+            ["nvidia-smi", "--query-gpu=memory.free", "--format=csv,noheader,nounits"],
+            capture_output=True,
+            text=True,
+            timeout=5
+        )
+        lines = result.stdout.strip().splitlines()
+        if result.returncode == 0 and lines:
+            return _to_int(lines[0].strip(), None)
+    except Exception as e:
+        log(f"Failed to read free VRAM: {e}")
+    return None
+
+
+@requires_gpu(None)
 def monitor_gpu_usage() -> Optional[Dict[str, any]]:
     """Monitor real-time GPU usage during processing."""
+    # NVML avoids spawning nvidia-smi (and re-initialising NVML) for every sample
+    handle = _nvml_handle()
+    if handle:
+        try:
+            return _monitor_gpu_usage_nvml(handle)
+        except Exception as e:
+            if ENABLE_GPU_MONITORING:
+                log(f"NVML monitoring failed, using nvidia-smi: {e}")
+
     try:
         result = subprocess.run(
             [
@@ -368,13 +588,13 @@ def monitor_gpu_usage() -> Optional[Dict[str, any]]:
         if result.returncode == 0:
             parts = [p.strip() for p in result.stdout.strip().split(",")]
             return {
-                "gpu_util": int(parts[0]) if parts[0].isdigit() else 0,
-                "encoder_util": int(parts[1]) if parts[1].isdigit() else 0,
-                "decoder_util": int(parts[2]) if parts[2].isdigit() else 0,
-                "memory_used_mb": int(parts[3]) if parts[3].replace('.', '').isdigit() else 0,
-                "memory_total_mb": int(parts[4]) if parts[4].replace('.', '').isdigit() else 0,
-                "temperature_c": int(float(parts[5])) if len(parts) > 5 else 0,
-                "power_draw_w": float(parts[6]) if len(parts) > 6 else 0.0
+                "gpu_util": _to_int(parts[0]),
+                "encoder_util": _to_int(parts[1]),
+                "decoder_util": _to_int(parts[2]),
+                "memory_used_mb": _to_int(parts[3]),
+                "memory_total_mb": _to_int(parts[4]),
+                "temperature_c": _to_int(parts[5]) if len(parts) > 5 else 0,
+                "power_draw_w": _to_float(parts[6]) if len(parts) > 6 else 0.0
             }
     except Exception as e:
         if ENABLE_GPU_MONITORING:
@@ -383,6 +603,21 @@ def monitor_gpu_usage() -> Optional[Dict[str, any]]:
     return None
 
 
+def _to_int(value: str, default: int = 0) -> int:
+    """nvidia-smi number (may be "12.0" or "[N/A]") as int."""
+    try:
+        return int(float(value))
+    except ValueError:
+        return default
+
+
+def _to_float(value: str, default: float = 0.0) -> float:
+    try:
+        return float(value)
+    except ValueError:
+        return default
+
+
 def format_gpu_usage(usage: Dict[str, any]) -> str:
     """Format GPU usage for display."""
     if not usage:
@@ -398,32 +633,38 @@ def format_gpu_usage(usage: Dict[str, any]) -> str:
     )
 
 
-def optimize_cuda_settings():
-    """Set optimal CUDA environment variables for video processing."""
+# Defaults only; anything already set in the environment wins
+_CUDA_ENV_DEFAULTS = {
     # Enable TensorFloat-32 for better performance on Ampere+ GPUs
-    if "CUDA_TF32_ENABLED" not in os.environ:
-        os.environ["CUDA_TF32_ENABLED"] = "1"
-    
+    "CUDA_TF32_ENABLED": "1",
     # Disable CUDA caching to save VRAM (enable for video processing)
-    if "CUDA_CACHE_DISABLE" not in os.environ:
-        os.environ["CUDA_CACHE_DISABLE"] = "0"
-    
+    "CUDA_CACHE_DISABLE": "0",
     # Set CUDA device order
-    if "CUDA_DEVICE_ORDER" not in os.environ:
-        os.environ["CUDA_DEVICE_ORDER"] = "PCI_BUS_ID"
-    
+    "CUDA_DEVICE_ORDER": "PCI_BUS_ID",
     # Enable all NVIDIA driver capabilities
-    if "NVIDIA_DRIVER_CAPABILITIES" not in os.environ:
-        os.environ["NVIDIA_DRIVER_CAPABILITIES"] = "compute,utility,video"
-    
+    "NVIDIA_DRIVER_CAPABILITIES": "compute,utility,video",
     # Ensure GPU is visible
-    if "NVIDIA_VISIBLE_DEVICES" not in os.environ:
-        os.environ["NVIDIA_VISIBLE_DEVICES"] = "all"
-    
+    "NVIDIA_VISIBLE_DEVICES": "all",
     # Set CUDA visible devices if not set
-    if "CUDA_VISIBLE_DEVICES" not in os.environ:
-        os.environ["CUDA_VISIBLE_DEVICES"] = "0"
+    "CUDA_VISIBLE_DEVICES": "0",
+    # Limit hardware work queues per context; several concurrent ffmpeg
+    # contexts then share the GPU with less driver-side serialization
+    "CUDA_DEVICE_MAX_CONNECTIONS": "2",
+}
+_CUDA_ENV_DONE = False
+
+
+def optimize_cuda_settings():
+    """Set optimal CUDA environment variables for video processing (once per process)."""
+    global _CUDA_ENV_DONE
+    
+    if _CUDA_ENV_DONE:
+        return
+    
+    for key, value in _CUDA_ENV_DEFAULTS.items():
+        os.environ.setdefault(key, value)
     
+    _CUDA_ENV_DONE = True
     log("CUDA environment optimized for video processing")
 
 
@@ -442,14 +683,18 @@ def print_gpu_status():
     print(f"Compute Capability:  {info['compute_capability']}")
     print(f"Driver Version:      {info['driver_version']}")
     print(f"Total VRAM:          {info['total_memory_mb']:,} MB")
-    print(f"Available VRAM:      {info['free_memory_mb']:,} MB")
-    print(f"Used VRAM:           {info['used_memory_mb']:,} MB")
+    
+    # Get current usage
+    usage = monitor_gpu_usage()
+    free_vram_mb = get_free_vram_mb()
+    if free_vram_mb is not None:
+        print(f"Available VRAM:      {free_vram_mb:,} MB")
+    if usage:
+        print(f"Used VRAM:           {usage['memory_used_mb']:,} MB")
     
     if info.get('pcie_gen'):
         print(f"PCIe:                Gen{info['pcie_gen']} x{info['pcie_width']}")
     
-    # Get current usage
-    usage = monitor_gpu_usage()
     if usage:
         print(f"\nCurrent Utilization:")
         print(f"  GPU Compute:       {usage['gpu_util']}%")
@@ -489,13 +734,14 @@ def validate_gpu_setup() -> bool:
     
     # Check minimum requirements
     info = get_gpu_info()
+    free_vram_mb = get_free_vram_mb() or 0
     
     warnings = []
     
-    if info['free_memory_mb'] < 4000:
+    if free_vram_mb < 4000:
         warnings.append("⚠️  Less than 4GB VRAM available - may struggle with 4K content")
     
-    if info['free_memory_mb'] < 2000:
+    if free_vram_mb < 2000:
         warnings.append("❌ Less than 2GB VRAM available - processing will likely fail")
         print("\n".join(warnings))
         print("="*70 + "\n")
@@ -522,30 +768,12 @@ def validate_gpu_setup() -> bool:
 def get_ffmpeg_gpu_filters() -> list:
     """Get list of available GPU-accelerated filters."""
     try:
-        result = subprocess.run(
-            [FFMPEG_BIN, "-hide_banner", "-filters"],
-            capture_output=True,
-            text=True,
-            timeout=10
-        )
-        
-        if result.returncode != 0:
-            return []
-        
-        gpu_filters = []
-        for line in result.stdout.split('\n'):
-            # Look for CUDA/NPP filters
-            if '_cuda' in line.lower() or '_npp' in line.lower():
-                # Extract filter name
-                parts = line.strip().split()
-                if len(parts) >= 2:
-                    filter_name = parts[1]
-                    gpu_filters.append(filter_name)
-        
-        return gpu_filters
-        
+        filters = _ffmpeg_components("filters")
     except Exception:
         return []
+    
+    # Look for CUDA/NPP filters
+    return sorted(f for f in filters or () if '_cuda' in f.lower() or '_npp' in f.lower())
 
 
 def log(message: str):
@@ -553,5 +781,12 @@ def log(message: str):
     print(f"[GPU] {message}")
 
 
-# Initialize CUDA settings on import
-optimize_cuda_settings()
\ No newline at end of file
+
+def init_gpu() -> bool:
+    """
+    Set the CUDA environment and run the GPU probe. Call once from the service
+    entry point, before any FFmpeg process is started; importing this module
+    no longer touches the environment.
+    """
+    optimize_cuda_settings()
+    return check_gpu_support()
\ No newline at end of file
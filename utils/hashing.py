@@ -6,4 +6,5 @@ def get_segment_hash(seg: Segment, input_path: str) -> str:
     data = f"{input_path}_{seg.start}_{seg.end}_{seg.is_original}_{len(seg.subtitles)}"
     if seg.edit:
         data += f"_{seg.edit.type}_{seg.edit.speed}_{seg.edit.zoom}"
-    return hashlib.md5(data.encode()).hexdigest()[:12]
+    # blake2b with a 6-byte digest gives the same 12 hex chars without a truncated MD5
+    return hashlib.blake2b(data.encode(), digest_size=6).hexdigest()
@@ -1,8 +1,9 @@
 import time
+import random
 import functools
 from utils.logging import log
 
-def retry(exceptions, tries=3, delay=1, backoff=2, logger=log):
+def retry(exceptions, tries=3, delay=1, backoff=2, logger=log, jitter=0.25, max_delay=60):
     """
     Retry decorator with exponential backoff.
     
@@ -11,6 +12,9 @@ def retry(exceptions, tries=3, delay=1, backoff=2, logger=log):
     :param delay: Initial delay between attempts in seconds.
     :param backoff: Backoff multiplier (e.g., 2 will double the delay each time).
     :param logger: Logger function to use.
+    :param jitter: Randomize each delay by up to this fraction, so workers that failed
+                   together don't all retry at the same instant.
+    :param max_delay: Upper bound for a single delay in seconds.
     """
     def decorator(func):
         @functools.wraps(func)
@@ -20,12 +24,13 @@ def retry(exceptions, tries=3, delay=1, backoff=2, logger=log):
                 try:
                     return func(*args, **kwargs)
                 except exceptions as e:
-                    msg = f"[RETRY] {str(e)}, Retrying in {mdelay} seconds..."
+                    sleep_for = min(mdelay, max_delay) * (1 - jitter + random.random() * 2 * jitter)
+                    msg = f"[RETRY] {str(e)}, Retrying in {sleep_for:.1f} seconds..."
                     if logger:
                         logger(msg)
                     else:
                         print(msg)
-                    time.sleep(mdelay)
+                    time.sleep(sleep_for)
                     mtries -= 1
                     mdelay *= backoff
             return func(*args, **kwargs)
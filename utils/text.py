@@ -1,8 +1,13 @@
+# Every escape maps one input character, so all of them apply in a single translate pass
+_FILTER_TEXT_ESCAPES = str.maketrans({
+    '\\': '\\\\',
+    "'": "'\\\\\\''",
+    ':': '\\:',
+    '[': '\\[',
+    ']': '\\]',
+})
+
+
 def escape_filter_text(text: str) -> str:
     """Escape text for FFmpeg filters."""
-    text = text.replace('\\', '\\\\')
-    text = text.replace("'", "'\\\\\\''")
-    text = text.replace(':', '\\:')
-    text = text.replace('[', '\\[')
-    text = text.replace(']', '\\]')
-    return text
+    return text.translate(_FILTER_TEXT_ESCAPES)
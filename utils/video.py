@@ -1,8 +1,14 @@
+import os
 import json
 import subprocess
+from collections import OrderedDict
 from typing import Dict, Any, Tuple
 from config import FFPROBE_BIN, RESOLUTION_PRESETS
 
+# get_video_info results keyed on (path, mtime_ns, size), so a replaced file is re-probed
+_VIDEO_INFO_CACHE: "OrderedDict[tuple, Dict[str, Any]]" = OrderedDict()
+_VIDEO_INFO_CACHE_MAX = 64
+
 def get_output_resolution(original_width: int, original_height: int, 
                           requested_res: str = "original") -> Tuple[int, int]:
     """
@@ -19,32 +25,83 @@ def get_output_resolution(original_width: int, original_height: int,
         
     return target_w, target_h
 
+# MP4 sample entry tags for the NVENC encoders (hvc1 on an H.264 stream is rejected by the muxer)
+_NVENC_MP4_TAGS = {"h264_nvenc": "avc1", "hevc_nvenc": "hvc1"}
+
 def compress_video_gpu(input_path: str, output_path: str, target_bitrate: str = "5M"):
     """
     Quickly compress a video using GPU to save disk space.
     Used for pre-processing large input files.
     """
     from config import FFMPEG_BIN, GPU_ENCODER
+    from utils.gpu import get_gpu_compute_capability
+
+    # Decode straight into CUDA frames so NVENC reads them without a round trip
+    # through system memory. NVDEC only handles AV1 from GA10x Ampere (compute 8.6) on.
+    hwaccel = ["-hwaccel", "cuda", "-hwaccel_output_format", "cuda"]
+    if get_video_info(input_path)["codec"] == "av1":
+        try:
+            cap = tuple(int(p) for p in (get_gpu_compute_capability() or "0.0").split(".")[:2])
+        except ValueError:
+            cap = (0, 0)
+        if cap < (8, 6):
+            print("⚠️  AV1 input on a GPU without AV1 decode, decoding on CPU")
+            hwaccel = []
+    # 10-bit sources decode to p010, which the 8-bit encode can't take; convert
+    # on the GPU (a no-op pass for nv12 input), or in swscale after a CPU decode
+    vf = ["-vf", "scale_cuda=format=nv12"] if hwaccel else ["-pix_fmt", "yuv420p"]
+
+    tag = _NVENC_MP4_TAGS.get(GPU_ENCODER)
     cmd = [
-        FFMPEG_BIN, "-y",
-        "-hwaccel", "cuda",
+        FFMPEG_BIN, "-y", "-loglevel", "error",
+        *hwaccel,
         "-i", input_path,
+        *vf,
         "-c:v", GPU_ENCODER,
         "-b:v", target_bitrate,
         "-preset", "p1", # Fastest possible preset for pre-processing
         "-tune", "ll",   # Low latency
-        "-tag:v", "hvc1",
+        *(["-tag:v", tag] if tag else []),
         "-c:a", "copy",   # Keep original audio
         output_path
     ]
     print(f"DEBUG: Compressing input video to save space: {input_path} -> {output_path}")
-    subprocess.run(cmd, capture_output=True, text=True)
+    # Only errors are kept (as bytes); a full-length encode log is never decoded
+    result = subprocess.run(cmd, stdout=subprocess.DEVNULL, stderr=subprocess.PIPE)
+    if result.returncode != 0:
+        print(f"DEBUG: Compression failed: {result.stderr.decode(errors='replace')[-1000:]}")
+        # The caller treats an existing output file as success
+        if os.path.exists(output_path):
+            os.remove(output_path)
 
 def get_video_info(path: str) -> Dict[str, Any]:
-    """Get video metadata efficiently with robust error handling."""
+    """Get video metadata efficiently with robust error handling (cached per file version)."""
+    try:
+        st = os.stat(path)
+        key = (path, st.st_mtime_ns, st.st_size)
+    except OSError:
+        key = None  # Let ffprobe report the problem
+
+    if key in _VIDEO_INFO_CACHE:
+        _VIDEO_INFO_CACHE.move_to_end(key)
+        return dict(_VIDEO_INFO_CACHE[key])
+
+    info, probed = _probe_video_info(path)
+    # Defaults filled in for a missing video stream are never cached, so a probe that
+    # caught the file mid-write or hit a transient error is redone on the next call
+    if key is not None and probed:
+        _VIDEO_INFO_CACHE[key] = info
+        if len(_VIDEO_INFO_CACHE) > _VIDEO_INFO_CACHE_MAX:
+            _VIDEO_INFO_CACHE.popitem(last=False)
+    return dict(info)
+
+
+def _probe_video_info(path: str) -> Tuple[Dict[str, Any], bool]:
+    """Probe path; the flag is False when no video stream was found and defaults were used."""
     try:
+        # One probe for all streams; the first video and first audio stream are picked below
         cmd = [
-            FFPROBE_BIN, "-v", "error", "-select_streams", "v:0",
+            FFPROBE_BIN, "-v", "error",
             "-show_entries", "stream=codec_name,codec_type,width,height,duration,r_frame_rate:format=duration",
             "-of", "json", path
         ]
@@ -56,7 +113,8 @@ def get_video_info(path: str) -> Dict[str, Any]:
         
         streams = data.get("streams", [])
         format_info = data.get("format", {})
-        v_stream = streams[0] if streams else {}
+        v_stream = next((st for st in streams if st.get("codec_type") == "video"), {})
+        a_stream = next((st for st in streams if st.get("codec_type") == "audio"), None)
         
         duration = float(v_stream.get("duration", format_info.get("duration", 0)))
         r_frame_rate = v_stream.get("r_frame_rate", "30/1")
@@ -67,23 +125,17 @@ def get_video_info(path: str) -> Dict[str, Any]:
         except (ValueError, ZeroDivisionError):
             fps = 30.0
             
-        cmd_audio = [FFPROBE_BIN, "-v", "error", "-select_streams", "a:0", 
-                     "-show_entries", "stream=codec_type", "-of", "json", path]
-        result_audio = subprocess.run(cmd_audio, capture_output=True, text=True, timeout=10)
-        has_audio = False
-        if result_audio.returncode == 0:
-            try:
-                has_audio = bool(json.loads(result_audio.stdout).get("streams"))
-            except json.JSONDecodeError:
-                pass
+        has_audio = a_stream is not None
+        audio_codec = a_stream.get("codec_name") if a_stream else None
         
         return {
             "fps": fps,
             "duration": duration,
             "has_audio": has_audio,
+            "audio_codec": audio_codec,
             "width": int(v_stream.get("width", 1920)),
             "height": int(v_stream.get("height", 1080)),
             "codec": v_stream.get("codec_name", "unknown")
-        }
+        }, bool(v_stream)
     except Exception as e:
         raise RuntimeError(f"Failed to get video info for {path}: {str(e)}")